@@ -0,0 +1,492 @@
+"""solver benchmarks
+
+usage: python benchmark.py [name ...]
+
+each benchmark builds its workload from seeded random games, so numbers are
+comparable between runs (and between revisions of the solver)
+"""
+
+import collections
+import contextlib
+import io
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Set, Tuple
+
+import solver
+from game_engine import Minesweeper, State
+from solver import (
+    BRANCHING_STRATEGIES,
+    CellProbabilities,
+    TREE_MIN_FRONT_SIZE,
+    EnumerationState,
+    MineCount,
+    PermutedRuleset,
+    Rule,
+    RuleReducer,
+    Rule_,
+    cell_probabilities,
+    condense_supercells,
+    enumerate_front,
+    expand_cells,
+    front_size,
+    permute_and_interfere,
+    tally_fronts,
+    reduce_and_split,
+    reduce_rules,
+    solve,
+    solve_certain,
+)
+
+
+def sample_boards(
+    n_games: int = 40, uncovered: float = 0.15, difficulty: str = "hard", seed: int = 0, integer_ids: bool = False
+) -> List[Tuple[Set[Rule], MineCount]]:
+    """collect the rules and mine count of a batch of seeded positions
+
+    each position uncovers a random fraction of the safe cells (without flood
+    filling), which scatters the revealed numbers and yields larger, more
+    tangled fronts than positions reached through normal play. integer_ids
+    names the cells by flat index rather than by string tag, whose hashes (and
+    so set orders) vary from process to process"""
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(n_games):
+        board = Minesweeper(difficulty, integer_ids=integer_ids, seed=rng)
+        safe = [(i, j) for i in range(board.n_rows) for j in range(board.n_cols) if (i, j) not in board.mines]
+        for i, j in rng.sample(safe, int(uncovered * len(safe))):
+            board.minefield[i][j]["state"] = State.UNCOVERED
+        mine_count = MineCount(total_cells=board.n_rows * board.n_cols, total_mines=board.n_mines)
+        positions.append((board.create_rules_from_minefield(), mine_count))
+    return positions
+
+
+def sample_rules(**kwargs) -> List[List[Rule_]]:
+    """collect the (condensed) rules of a batch of seeded positions; see
+    sample_boards()"""
+    return [condense_supercells(rules)[0] for rules, _ in sample_boards(**kwargs)]
+
+
+def sample_positions(**kwargs) -> List[Set[Rule_]]:
+    """collect the logically-reduced, non-trivial rules of a batch of seeded
+    positions; see sample_rules()"""
+    return [set(rule for rule in reduce_rules(rules) if not rule.is_trivial()) for rules in sample_rules(**kwargs)]
+
+
+def sample_fronts(**kwargs) -> List[PermutedRuleset]:
+    """collect the fronts of a batch of seeded positions; see sample_rules()"""
+    fronts = []
+    for rules in sample_positions(**kwargs):
+        fronts.extend(front for front in permute_and_interfere(rules).split_fronts() if not front.is_trivial())
+    return fronts
+
+
+def bench_enumerate() -> None:
+    """node throughput of the exhaustive front enumeration, and of tallying
+    the same configurations"""
+    fronts = sample_fronts()
+    states = [EnumerationState(front) for front in fronts]
+
+    start = time.perf_counter()
+    configs = sum(sum(1 for _ in state.enumerate()) for state in states)
+    elapsed = time.perf_counter() - start
+
+    nodes = sum(state.nodes for state in states)
+    print("enumerate: %d fronts, %d nodes, %d configurations" % (len(fronts), nodes, configs))
+    print("  %.3fs, %.0f nodes/s, %.0f configurations/s" % (elapsed, nodes / elapsed, configs / elapsed))
+
+    # the same search, tallying configurations rather than generating them
+    states = [EnumerationState(front) for front in fronts]
+    start = time.perf_counter()
+    for state in states:
+        state.count()
+    elapsed = time.perf_counter() - start
+    print("count: %.3fs, %.0f configurations/s" % (elapsed, configs / elapsed))
+
+
+def bench_branching() -> None:
+    """search tree size and speed of each branching strategy, on the same fronts"""
+    fronts = sample_fronts()
+    for name in BRANCHING_STRATEGIES:
+        states = [EnumerationState(front, name) for front in fronts]
+
+        start = time.perf_counter()
+        for state in states:
+            for _ in state.enumerate():
+                pass
+        elapsed = time.perf_counter() - start
+
+        nodes = sum(state.nodes for state in states)
+        dead_ends = sum(state.dead_ends for state in states)
+        print("branching %-9s: %8d nodes, %7d dead ends, %.3fs" % (name, nodes, dead_ends, elapsed))
+
+
+def bench_tally() -> None:
+    """tallying dense fronts, where the largest are counted by tree
+    decomposition instead of enumerated"""
+    fronts = sample_fronts(uncovered=0.2, n_games=10)
+    large = sum(1 for front in fronts if front_size(front) >= TREE_MIN_FRONT_SIZE)
+
+    start = time.perf_counter()
+    for front in fronts:
+        enumerate_front(front)
+    elapsed = time.perf_counter() - start
+    print("tally: %d fronts (%d past the tree decomposition threshold), %.3fs" % (len(fronts), large, elapsed))
+
+
+def bench_approx() -> None:
+    """accuracy of approximate solving against exact solving, with every
+    front sampled regardless of size"""
+    boards = sample_boards(n_games=10)
+    for budget_ms in (20, 100, 500):
+        errors, misses, widths, samples, elapsed = [], 0, [], 0, 0.0
+        rng = random.Random(0)
+        for rules, mine_count in boards:
+            expected = solve(rules, mine_count)
+            min_cost, solver.APPROX_MIN_COST = solver.APPROX_MIN_COST, 0
+            start = time.perf_counter()
+            try:
+                solution = solve(rules, mine_count, mode="approx", budget_ms=budget_ms, rng=rng)
+            finally:
+                solver.APPROX_MIN_COST = min_cost
+            elapsed += time.perf_counter() - start
+            samples += solution.samples
+            for cell, p in expected.items():
+                lo, hi = solution.intervals[cell]
+                errors.append(abs(solution[cell] - p))
+                misses += not (lo <= p <= hi)
+                widths.append(hi - lo)
+        print(
+            "approx %4dms: %d samples, max error %.4f, mean error %.5f, %.1f%% of cells outside their interval"
+            " (mean width %.4f), %.3fs"
+            % (
+                budget_ms,
+                samples,
+                max(errors),
+                sum(errors) / len(errors),
+                100.0 * misses / len(errors),
+                sum(widths) / len(widths),
+                elapsed,
+            )
+        )
+
+
+def bench_certain() -> None:
+    """full solves against certainties-only solves of the same positions"""
+    boards = sample_boards(n_games=20, uncovered=0.3)
+
+    start = time.perf_counter()
+    for rules, mine_count in boards:
+        solve(rules, mine_count)
+    elapsed = time.perf_counter() - start
+    print("solve: %d positions, %.3fs" % (len(boards), elapsed))
+
+    start = time.perf_counter()
+    certain = [solve_certain(rules) for rules, _ in boards]
+    elapsed = time.perf_counter() - start
+    print(
+        "solve_certain: %.3fs, %d certain cells, %d positions with a safe cell"
+        % (elapsed, sum(map(len, certain)), sum(1 for c in certain if 0.0 in c.values()))
+    )
+
+
+def bench_query() -> None:
+    """cost of turning a solution into answers: expanding it into a dict for
+    every cell, against querying a few cells of a CellProbabilities"""
+    solutions = []
+    for rules, mine_count in sample_boards(n_games=20, uncovered=0.3):
+        condensed, all_cells = condense_supercells(rules)
+        determined, fronts = reduce_and_split(condensed)
+        tallies = set(tally_fronts(fronts))
+        tallies.update(rule.tally() for rule in determined)
+        candidates = [cell for rule in list(rules)[:5] for cell in rule.cells]
+        solutions.append((list(cell_probabilities(tallies, mine_count, all_cells)), candidates))
+
+    repeat = 50
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for cell_probs, candidates in solutions:
+            expanded = dict(expand_cells(cell_probs, None))
+            [expanded[cell] for cell in candidates]
+    elapsed = time.perf_counter() - start
+    print("expand_cells: %d solutions, %.1fus each" % (len(solutions), 1e6 * elapsed / repeat / len(solutions)))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for cell_probs, candidates in solutions:
+            CellProbabilities(cell_probs).probs(candidates)
+    elapsed = time.perf_counter() - start
+    print("CellProbabilities.probs: %.1fus each" % (1e6 * elapsed / repeat / len(solutions)))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for cell_probs, candidates in solutions:
+            CellProbabilities(cell_probs).argmin()
+    elapsed = time.perf_counter() - start
+    print("CellProbabilities.argmin: %.1fus each" % (1e6 * elapsed / repeat / len(solutions)))
+
+
+def bench_immutables() -> None:
+    """hashing, memory and solve throughput of the rule and permutation
+    objects on late-game positions (most of the safe cells uncovered), with
+    and without interning"""
+    boards = sample_boards(n_games=20, uncovered=0.6)
+    positions = [condense_supercells(rules)[0] for rules, _ in boards]
+
+    rulesets = [permute_and_interfere(reduce_rules(rules)) for rules in positions]
+    permus = [permu for ruleset in rulesets for permuset in ruleset.permu_map.values() for permu in permuset]
+    repeat = 20
+    start = time.perf_counter()
+    for _ in range(repeat):
+        set(permus)
+    elapsed = time.perf_counter() - start
+    print("hash: %d permutations, %.1fns each" % (len(permus), 1e9 * elapsed / repeat / len(permus)))
+    # drop them, or interning below would share the new instances with these
+    del rulesets, permus
+
+    for intern in (False, True):
+        solver.INTERN_IMMUTABLES = intern
+        try:
+            start = time.perf_counter()
+            for rules, mine_count in boards:
+                solve(rules, mine_count)
+            elapsed = time.perf_counter() - start
+
+            # one position at a time: positions of different games share cell
+            # coordinates, so interning would share rules across them too
+            retained = peak = 0
+            for rules in positions:
+                tracemalloc.start()
+                ruleset = permute_and_interfere(reduce_rules(rules))
+                size, size_peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                del ruleset
+                retained += size
+                peak = max(peak, size_peak)
+        finally:
+            solver.INTERN_IMMUTABLES = False
+        print(
+            "interning %s: solve %d positions, %.3fs; rulesets retain %.1fKiB (largest peak %.1fKiB)"
+            % ("on" if intern else "off", len(boards), elapsed, retained / 1024.0, peak / 1024.0)
+        )
+
+
+def bench_board() -> None:
+    """memory and board-wide query cost of list-backed and array-backed boards
+    (the latter needs numpy), on a large board with a random 15% of its safe
+    cells uncovered"""
+    size, n_mines = 500, 40000
+    for array_backed in (False, True):
+        rng = random.Random(0)
+        tracemalloc.start()
+        try:
+            board = Minesweeper(None, array_backed=array_backed, rows=size, columns=size, mines=n_mines, seed=rng)
+        except ImportError:
+            tracemalloc.stop()
+            print("arrays: numpy not installed")
+            continue
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        safe = [k for k in range(size * size) if divmod(k, size) not in board.mines]
+        for k in rng.sample(safe, int(0.15 * len(safe))):
+            i, j = divmod(k, size)
+            board.minefield[i][j]["state"] = State.UNCOVERED
+
+        # time a repeat call; the first also generates the tags of the covered cells
+        board.create_rules_from_minefield()
+        start = time.perf_counter()
+        rules = board.create_rules_from_minefield()
+        rules_elapsed = time.perf_counter() - start
+        print(
+            "%s: %dx%d board, %.1fMiB; %d rules in %.3fs"
+            % ("arrays" if array_backed else "lists", size, size, memory / 2.0**20, len(rules), rules_elapsed)
+        )
+
+
+def bench_reveal() -> None:
+    """flood fill cost: reveal random safe cells of sparse 500x500 boards,
+    whose first moves open up most of the board"""
+    size, n_mines, n_games, n_moves = 500, 2500, 5, 50
+    for array_backed in (False, True):
+        rng = random.Random(0)
+        try:
+            boards = [
+                Minesweeper(None, array_backed=array_backed, rows=size, columns=size, mines=n_mines, seed=rng)
+                for _ in range(n_games)
+            ]
+        except ImportError:
+            print("arrays: numpy not installed")
+            continue
+        moves = [
+            rng.sample([(i, j) for i in range(size) for j in range(size) if (i, j) not in board.mines], n_moves)
+            for board in boards
+        ]
+
+        uncovered = 0
+        start = time.perf_counter()
+        for board, cells in zip(boards, moves):
+            for i, j in cells:
+                uncovered += len(board.reveal(i, j))
+        elapsed = time.perf_counter() - start
+        print(
+            "%s: %d games x %d moves, %d cells uncovered, %.3fs (%.2fus per cell)"
+            % ("arrays" if array_backed else "lists", n_games, n_moves, uncovered, elapsed, 1e6 * elapsed / uncovered)
+        )
+
+
+def bench_frontier() -> None:
+    """per-move cost of keeping the rules current on a 200x200 board at hard's
+    mine density: the rule delta reveal() maintains, against rescanning the
+    board for rules after every move"""
+    size, n_mines, n_moves = 200, 3100, 300
+    rng = random.Random(0)
+    board = Minesweeper(None, rows=size, columns=size, mines=n_mines, seed=rng)
+    safe = [(i, j) for i in range(size) for j in range(size) if (i, j) not in board.mines]
+    moves = rng.sample(safe, n_moves)
+
+    reveal_elapsed = delta_elapsed = scan_elapsed = 0.0
+    changed = 0
+    rules: Set[Rule] = set()
+    for i, j in moves:
+        start = time.perf_counter()
+        board.reveal(i, j)
+        reveal_elapsed += time.perf_counter() - start
+
+        start = time.perf_counter()
+        added, removed = board.rule_delta()
+        delta_elapsed += time.perf_counter() - start
+        changed += len(added) + len(removed)
+
+        start = time.perf_counter()
+        scanned = board.create_rules_from_minefield()
+        added, removed = scanned - rules, rules - scanned
+        rules = scanned
+        scan_elapsed += time.perf_counter() - start
+
+    print("%d moves, %d rules at the end, %d rules added or removed" % (n_moves, len(rules), changed))
+    print("  reveal (including frontier upkeep): %.1fms per move" % (1e3 * reveal_elapsed / n_moves))
+    print("  rule_delta: %.3fms per move" % (1e3 * delta_elapsed / n_moves))
+    print("  rescan and diff: %.1fms per move" % (1e3 * scan_elapsed / n_moves))
+
+
+def bench_generate() -> None:
+    """cost of laying the mines (and counting their neighbors) on a fresh
+    board, with the first click kept safe; and that a seed reproduces the
+    board and the games played on it"""
+    for array_backed, size, n_mines in ((False, 200, 6000), (True, 200, 6000), (True, 1000, 150000)):
+        try:
+            board = Minesweeper(
+                None, array_backed=array_backed, rows=size, columns=size, mines=n_mines, seed=0, first_click_safe=True
+            )
+        except ImportError:
+            print("arrays: numpy not installed")
+            break
+        board.neighbor_table  # built once per shape, so keep it out of the timing
+        n_boards = 20
+        start = time.perf_counter()
+        for k in range(n_boards):
+            board.rng = random.Random(k)
+            board.place_mines(safe=(size // 2, size // 2))
+        elapsed = time.perf_counter() - start
+        print(
+            "%s: %dx%d board, %d mines, %.2fms per board"
+            % ("arrays" if array_backed else "lists", size, size, n_mines, 1e3 * elapsed / n_boards)
+        )
+
+    def self_play(seed: int, array_backed: bool) -> Tuple[Set[Tuple[int, int]], List[Tuple[int, int]]]:
+        board = Minesweeper("hard", array_backed=array_backed, seed=seed, first_click_safe=True)
+        board.reveal(board.n_rows // 2, board.n_cols // 2)
+        uncovered: List[Tuple[int, int]] = []
+        while not board.game_over and not board.check_win():
+            safe, _ = board.safe_and_mine_cells()
+            cells = [cell for cell in safe if board.minefield[cell[0]][cell[1]]["state"] != State.UNCOVERED]
+            if not cells:
+                break
+            for i, j in sorted(cells):
+                uncovered.extend(board.reveal(i, j))
+        return board.mines, uncovered
+
+    for array_backed in (False, True):
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                runs = [self_play(seed, array_backed) for seed in range(5) for _ in range(2)]
+        except ImportError:
+            continue
+        print(
+            "%s: same-seed boards and games reproduced: %s"
+            % ("arrays" if array_backed else "lists", all(runs[k] == runs[k + 1] for k in range(0, len(runs), 2)))
+        )
+
+
+def bench_constraints() -> None:
+    """cost of the constraint-propagation setup: cross-eliminating the
+    permutations of each position's rules, re-reducing them, and building the
+    compatibility index of each front"""
+    positions = sample_positions()
+    rulesets = [PermutedRuleset(rules) for rules in positions]
+
+    start = time.perf_counter()
+    for ruleset in rulesets:
+        ruleset.cross_eliminate()
+    elapsed = time.perf_counter() - start
+    print("cross_eliminate: %d positions, %.3fs" % (len(rulesets), elapsed))
+    eliminated = [ruleset.eliminated for ruleset in rulesets]
+    print(
+        "  %d permutations eliminated, in up to %d passes"
+        % (sum(map(sum, eliminated)), max(len(passes) for passes in eliminated))
+    )
+
+    start = time.perf_counter()
+    for ruleset in rulesets:
+        ruleset.rereduce()
+    elapsed = time.perf_counter() - start
+    print("rereduce: %d positions, %.3fs" % (len(rulesets), elapsed))
+
+    fronts = []
+    for ruleset in rulesets:
+        fronts.extend(front for front in ruleset.split_fronts() if not front.is_trivial())
+
+    start = time.perf_counter()
+    for front in fronts:
+        EnumerationState(front)
+    elapsed = time.perf_counter() - start
+    print("compatibility index: %d fronts, %.3fs" % (len(fronts), elapsed))
+
+
+def bench_reduce() -> None:
+    """cost of the logical deduction phase"""
+    positions = sample_rules(uncovered=0.3)
+
+    reducers = [RuleReducer() for _ in positions]
+    start = time.perf_counter()
+    for reducer, rules in zip(reducers, positions):
+        reduce_rules(rules, reducer)
+    elapsed = time.perf_counter() - start
+
+    stats = sum((reducer.stats for reducer in reducers), collections.Counter())
+    print("reduce_rules: %d positions, %d rules, %.3fs" % (len(positions), sum(map(len, positions)), elapsed))
+    print("  %(queued)d reductions queued, %(popped)d popped, %(stale)d stale" % stats)
+
+
+benchmarks: Dict[str, Callable[[], None]] = {
+    "enumerate": bench_enumerate,
+    "branching": bench_branching,
+    "tally": bench_tally,
+    "approx": bench_approx,
+    "certain": bench_certain,
+    "query": bench_query,
+    "immutables": bench_immutables,
+    "board": bench_board,
+    "reveal": bench_reveal,
+    "frontier": bench_frontier,
+    "generate": bench_generate,
+    "constraints": bench_constraints,
+    "reduce": bench_reduce,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or benchmarks:
+        benchmarks[name]()
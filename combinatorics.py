@@ -0,0 +1,67 @@
+import functools
+import math
+
+
+class Combinatorics(object):
+    """cached binomials and log-factorials
+
+    exact binomials for small n (the common case: supercell sizes) come from
+    growable rows of pascal's triangle; larger ones go through a bounded memo.
+    choose() returns unbounded ints, where it used to return floats: products
+    of them (e.g., configuration counts) can pass the float range, so callers
+    mixing them with floats should divide int by int, or work with
+    log_choose(), rather than convert with float(). the log-factorial table
+    grows on demand (doubling), up to the largest n actually asked for"""
+
+    # largest n kept in pascal's triangle
+    max_pascal_n = 64
+    # most binomials memoized beyond the triangle
+    max_memo = 4096
+
+    def __init__(self, size: int = 0) -> None:
+        # pascal[n][k] = n choose k
+        self.pascal = [[1]]
+        # log_factorials[n] = ln(n!)
+        self.log_factorials = [0.0]
+        # n choose k, for n beyond the triangle
+        self.binomial = functools.lru_cache(maxsize=self.max_memo)(math.comb)
+        self.reserve(size)
+
+    def reserve(self, n: int) -> None:
+        """make sure the log-factorial table covers 0..n"""
+        self.log_factorials.extend(math.lgamma(i + 1) for i in range(len(self.log_factorials), n + 1))
+
+    def choose(self, n: int, k: int) -> int:
+        """return n choose k, exactly (an int, however large)"""
+        if k < 0 or k > n:
+            return 0
+        if n <= self.max_pascal_n:
+            while n >= len(self.pascal):
+                row = self.pascal[-1]
+                self.pascal.append([1] + [a + b for a, b in zip(row, row[1:])] + [1])
+            return self.pascal[n][k]
+        return self.binomial(n, k)
+
+    def log_factorial(self, n: int) -> float:
+        """return ln(n!)"""
+        if n >= len(self.log_factorials):
+            self.reserve(max(n, 2 * len(self.log_factorials)))
+        return self.log_factorials[n]
+
+    def log_choose(self, n: int, k: int) -> float:
+        """return ln(n choose k); -inf if n choose k is 0"""
+        if k < 0 or k > n:
+            return -math.inf
+        return self.log_factorial(n) - self.log_factorial(k) - self.log_factorial(n - k)
+
+    def fact_div(self, a: int, b: int) -> float:
+        """return a! / b!; exact (an int) if a >= b"""
+        return math.perm(a, a - b) if a >= b else 1.0 / math.perm(b, b - a)
+
+
+# shared tables
+tables = Combinatorics()
+
+choose = tables.choose
+log_choose = tables.log_choose
+fact_div = tables.fact_div
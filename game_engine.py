@@ -1,8 +1,19 @@
 import random
 import string
+import functools
+import weakref
+from array import array
+from collections import Counter, deque
+from collections.abc import MutableMapping, Sequence
 from dataclasses import dataclass
-from solver import Rule, MineCount, solve
-from typing import Tuple, Dict, List, Set, Union
+from solver import Rule, MineCount, CancellationToken, FrontTallyCache, SolverSession, Solution, solve_certain
+from typing import Any, Deque, Tuple, Dict, List, Set, Union, Iterable, Iterator, Optional
+
+# Only needed for array-backed boards
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Type-hinted dictionary for game modes
 game_mode: Dict[str, Dict[str, int]] = {
@@ -12,6 +23,9 @@ game_mode: Dict[str, Dict[str, int]] = {
     "hard": {"rows": 16, "columns": 40, "mines": 99},
 }
 
+# Front tallies are shared across moves and across games
+tally_cache: FrontTallyCache = FrontTallyCache()
+
 
 @dataclass
 class State:
@@ -42,68 +56,486 @@ class TagGenerator:
         return tag
 
 
-import random
-from typing import List, Tuple, Set
+class Topology:
+    """
+    How the cells of a board connect: a square grid, where each cell neighbors the (up to) 8
+    cells around it. Other topologies override offsets() and the class attributes; the neighbor
+    table and the vectorized neighbor counts are both derived from them.
+    """
+
+    # offsets(i) depends only on i % period
+    period: int = 1
+    # Neighbors wrap around the edges of the board
+    wrap: bool = False
+
+    def offsets(self, i: int) -> List[Tuple[int, int]]:
+        """
+        Returns:
+            offsets: (row, column) offsets from a cell in row i to its neighbors, each within 1
+        """
+        return [(di, dj) for di in (-1, 0, 1) for dj in (-1, 0, 1) if (di, dj) != (0, 0)]
+
+    def max_neighbors(self) -> int:
+        """
+        Returns:
+            max_neighbors: the most neighbors a cell can have (cells along the edges may have fewer)
+        """
+        return max(len(self.offsets(i)) for i in range(self.period))
+
+    def check_shape(self, n_rows: int, n_cols: int) -> None:
+        """Raise ValueError if the topology can't be laid out on a board of this shape."""
+
+
+class TorusTopology(Topology):
+    """A square grid whose edges wrap around: every cell has 8 neighbors."""
+
+    wrap = True
+
+    def check_shape(self, n_rows: int, n_cols: int) -> None:
+        # Any narrower and a cell's wrapped neighbors would coincide
+        if n_rows < 3 or n_cols < 3:
+            raise ValueError("torus boards need at least 3 rows and columns")
+
+
+class HexTopology(Topology):
+    """Hexagonal cells in rows, odd rows shifted right by half a cell: each cell has 6 neighbors."""
+
+    period = 2
+
+    def offsets(self, i: int) -> List[Tuple[int, int]]:
+        shift = i % 2
+        return [(-1, shift - 1), (-1, shift), (0, -1), (0, 1), (1, shift - 1), (1, shift)]
+
+
+topologies: Dict[str, Topology] = {"square": Topology(), "torus": TorusTopology(), "hex": HexTopology()}
+
+
+class NeighborTable:
+    """
+    The neighbors of every cell of a board, in compressed sparse row form: the neighbors of the
+    cell at flat index k (row * n_cols + col) are indices[offsets[k] : offsets[k + 1]].
+    """
+
+    def __init__(self, n_rows: int, n_cols: int, topology: Topology) -> None:
+        self.offsets: array = array("i", [0])
+        self.indices: array = array("i")
+        if np is not None:
+            self.build_vectorized(n_rows, n_cols, topology)
+            return
+        for i in range(n_rows):
+            deltas = topology.offsets(i)
+            for j in range(n_cols):
+                for di, dj in deltas:
+                    x, y = i + di, j + dj
+                    if topology.wrap:
+                        x, y = x % n_rows, y % n_cols
+                    elif not (0 <= x < n_rows and 0 <= y < n_cols):
+                        continue
+                    self.indices.append(x * n_cols + y)
+                self.offsets.append(len(self.indices))
+
+    def build_vectorized(self, n_rows: int, n_cols: int, topology: Topology) -> None:
+        """Build the same table with numpy, one offset of one row parity at a time: count every
+        cell's neighbors to lay out the offsets, then drop each neighbor into the next free slot of
+        its cell's run. Both passes write straight into the final arrays, so no cells x offsets
+        matrix is ever built."""
+        period = topology.period
+        cols = np.arange(n_cols, dtype=np.intc)[None, :]
+
+        def targets(parity: int, di: int, dj: int) -> Tuple[Any, "np.ndarray"]:
+            # where the offset lands from each cell of the rows of this parity; None if all on-board
+            x, y = np.arange(parity, n_rows, period, dtype=np.intc)[:, None] + di, cols + dj
+            if topology.wrap:
+                return None, (x % n_rows) * n_cols + y % n_cols
+            return (0 <= x) & (x < n_rows) & (0 <= y) & (y < n_cols), x * n_cols + y
+
+        counts = np.zeros((n_rows, n_cols), dtype=np.intc)
+        for parity in range(period):
+            for di, dj in topology.offsets(parity):
+                valid, _ = targets(parity, di, dj)
+                counts[parity::period] += 1 if valid is None else valid
+        self.offsets = array("i", [0]) * (n_rows * n_cols + 1)
+        offsets = np.frombuffer(self.offsets, dtype=np.intc)
+        np.cumsum(counts, out=offsets[1:])
+        self.indices = array("i", [0]) * int(offsets[-1])
+        indices = np.frombuffer(self.indices, dtype=np.intc)
+        # next free slot of every cell's run; reuses the counts
+        free = counts
+        free.flat = offsets[:-1]
+        for parity in range(period):
+            for di, dj in topology.offsets(parity):
+                valid, target = targets(parity, di, dj)
+                slots = free[parity::period]
+                if valid is None:
+                    indices[slots] = target
+                    slots += 1
+                else:
+                    indices[slots[valid]] = target[valid]
+                    slots[valid] += 1
+
+    def neighbors(self, k: int) -> array:
+        return self.indices[self.offsets[k] : self.offsets[k + 1]]
+
+
+# Neighbor tables of the boards alive, by shape; held weakly, so a table goes with its last board
+neighbor_tables: "weakref.WeakValueDictionary[Tuple[int, int, Topology], NeighborTable]" = weakref.WeakValueDictionary()
+
+
+def shared_neighbor_table(n_rows: int, n_cols: int, topology: Topology) -> NeighborTable:
+    """Build the neighbor table of a board shape, or reuse that of a live board of the same shape."""
+    key = (n_rows, n_cols, topology)
+    table = neighbor_tables.get(key)
+    if table is None:
+        table = neighbor_tables[key] = NeighborTable(n_rows, n_cols, topology)
+    return table
+
+
+def count_neighbors(mask: "np.ndarray", topology: Topology = topologies["square"]) -> "np.ndarray":
+    """
+    Count, for every cell, how many of its neighbors are set in a boolean board array, as a sum of
+    shifted copies of the board (one per neighbor offset).
+
+    Returns:
+        counts: int8 array of the board's shape
+    """
+    n_rows, n_cols = mask.shape
+    if topology.wrap:
+        source = mask.astype(np.int8)
+    else:
+        source = np.zeros((n_rows + 2, n_cols + 2), dtype=np.int8)
+        source[1:-1, 1:-1] = mask
+    counts = np.zeros(mask.shape, dtype=np.int8)
+    for parity in range(topology.period):
+        rows = slice(parity, None, topology.period)
+        for di, dj in topology.offsets(parity):
+            if topology.wrap:
+                shifted = np.roll(source, (-di, -dj), axis=(0, 1))
+            else:
+                shifted = source[1 + di : 1 + di + n_rows, 1 + dj : 1 + dj + n_cols]
+            counts[rows] += shifted[rows]
+    return counts
+
+
+class CellView(MutableMapping):
+    """
+    A cell of an array-backed board, read and written like the {"mine_count", "state"} dicts of a
+    list-backed one; see MinefieldView.
+    """
+
+    __slots__ = ("board", "i", "j")
+
+    def __init__(self, board: "Minesweeper", i: int, j: int) -> None:
+        self.board = board
+        self.i = i
+        self.j = j
+
+    def array(self, key: str) -> "np.ndarray":
+        if key == "mine_count":
+            return self.board.mine_counts
+        if key == "state":
+            return self.board.cell_states
+        raise KeyError(key)
+
+    def __getitem__(self, key: str) -> int:
+        return int(self.array(key)[self.i, self.j])
+
+    def __setitem__(self, key: str, value: int) -> None:
+        self.array(key)[self.i, self.j] = value
+
+    def __delitem__(self, key: str) -> None:
+        raise TypeError("board cells have a fixed set of keys")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(("mine_count", "state"))
+
+    def __len__(self) -> int:
+        return 2
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class MinefieldView(Sequence):
+    """
+    The board of an array-backed Minesweeper as the list of rows of cell dicts that list-backed
+    boards store, for callers that index board.minefield[i][j][key]. Each access goes through to
+    the arrays, so it stays in sync with them (and is slow; board-wide code should use the arrays).
+    """
+
+    def __init__(self, board: "Minesweeper", i: Optional[int] = None) -> None:
+        """
+        Args:
+            board: the array-backed board
+            i: view only this row
+        """
+        self.board = board
+        self.i = i
+
+    def __getitem__(self, index: int) -> Union["MinefieldView", CellView]:
+        size = self.board.n_rows if self.i is None else self.board.n_cols
+        if not -size <= index < size:
+            raise IndexError(index)
+        index %= size
+        return MinefieldView(self.board, index) if self.i is None else CellView(self.board, self.i, index)
+
+    def __len__(self) -> int:
+        return self.board.n_rows if self.i is None else self.board.n_cols
 
 
 class Minesweeper:
-    def __init__(self, difficulty: str) -> None:
+    def __init__(
+        self,
+        difficulty: Optional[str],
+        integer_ids: bool = False,
+        array_backed: bool = False,
+        rows: Optional[int] = None,
+        columns: Optional[int] = None,
+        mines: Optional[int] = None,
+        topology: str = "square",
+        seed: Union[int, random.Random, None] = None,
+        first_click_safe: bool = False,
+    ) -> None:
+        """
+        Args:
+            difficulty: key into game_mode; None for a custom board given entirely by rows,
+                columns and mines
+            integer_ids: tag covered cells with their flat index (row * n_cols + col)
+                instead of generated string tags; see solve_minefield_flat()
+            array_backed: store the board as int8 numpy arrays (mine_counts, cell_states)
+                rather than a dict per cell; minefield is then a view onto them. Needs numpy
+            rows, columns, mines: override the dimensions / mine count of the difficulty
+            topology: key into topologies
+            seed: seed for laying the mines and for random_safe_reveal(), or a random.Random to
+                draw from (e.g. one shared by a series of boards); None draws from the random
+                module's global state. Array-backed boards lay their mines with a numpy
+                generator seeded from it, so they differ from list-backed boards of the same seed
+            first_click_safe: lay the mines on the first reveal(), keeping the revealed cell and
+                its neighbors free of them
+        """
+        mode: Dict[str, int] = dict(game_mode[difficulty]) if difficulty is not None else {}
+        for key, value in (("rows", rows), ("columns", columns), ("mines", mines)):
+            if value is not None:
+                mode[key] = value
+        if len(mode) < 3:
+            raise ValueError("custom boards need rows, columns and mines")
+        if array_backed and np is None:
+            raise ImportError("array-backed boards need numpy")
+
+        self.integer_ids: bool = integer_ids
+        self.array_backed: bool = array_backed
         self.game_over: bool = False
         self.game_won: bool = False
         self.states: type[State] = State
-        self.n_rows: int = game_mode[difficulty]["rows"]
-        self.n_cols: int = game_mode[difficulty]["columns"]
+        self.n_rows: int = mode["rows"]
+        self.n_cols: int = mode["columns"]
         self.shape: Tuple[int, int] = (self.n_rows, self.n_cols)
-        self.n_mines: int = game_mode[difficulty]["mines"]
-
-        self.minefield = [
-            [{"mine_count": 0, "state": self.states.COVERED} for _ in range(self.n_cols)] for _ in range(self.n_rows)
-        ]
+        self.n_mines: int = mode["mines"]
+        self.topology: Topology = topologies[topology]
+        self.topology.check_shape(self.n_rows, self.n_cols)
+        # A safe first click keeps itself and (at most) all its neighbors clear
+        n_cells = self.n_rows * self.n_cols
+        cleared = min(1 + self.topology.max_neighbors(), n_cells) if first_click_safe else 0
+        if self.n_mines > n_cells - cleared:
+            raise ValueError("more mines than cells to put them in")
+        self.rng: Any = random if seed is None else seed if isinstance(seed, random.Random) else random.Random(seed)
+
+        # Most of the engine addresses cells by flat index, row * n_cols + col, through these
+        if array_backed:
+            # -1 for a mine, else the # of neighboring mines
+            self.mine_counts: np.ndarray = np.zeros(self.shape, dtype=np.int8)
+            self.cell_states: np.ndarray = np.full(self.shape, State.COVERED, dtype=np.int8)
+            self.minefield: Any = MinefieldView(self)
+            # Flat views of the same arrays
+            self.flat_mine_counts: np.ndarray = self.mine_counts.reshape(-1)
+            self.flat_cell_states: np.ndarray = self.cell_states.reshape(-1)
+        else:
+            self.minefield = [
+                [{"mine_count": 0, "state": self.states.COVERED} for _ in range(self.n_cols)]
+                for _ in range(self.n_rows)
+            ]
+            # The same cell dicts, in row-major order
+            self.flat_minefield: List[Dict[str, int]] = [cell for row in self.minefield for cell in row]
+
+        # Kept up to date by reveal() and reveal_all_mines(); setting cell states directly
+        # through minefield / cell_states bypasses it
+        self.n_covered: int = self.n_rows * self.n_cols
 
         self.mines: Set[Tuple[int, int]] = set()
-        self.place_mines()
+        self.mines_placed: bool = False
+        if not first_click_safe:
+            self.place_mines()
+
+        # Tags are kept across solves so that unchanged rules compare equal between moves
+        # (keyed by flat index)
+        self.tags: Dict[int, str] = {}
+        self.tag_generator: TagGenerator = TagGenerator()
+        self.tag_to_index: Dict[str, Tuple[int, int]] = {}
+        # The frontier, kept up to date by reveal(): uncovered number (flat index) -> its rule,
+        # for the numbers with covered neighbors
+        self.frontier: Dict[int, Rule] = {}
+        # The frontier's rules; distinct numbers can yield equal rules, hence the counts
+        self.rule_counts: Counter = Counter()
+        # Per consumer of rule_delta(): rules that came or went since its last call -> whether
+        # they were live then
+        self.changed_rules: Dict[str, Dict[Rule, bool]] = {}
+        # Incremental solver; fed the rules added/removed since the previous solve
+        self.session: SolverSession = SolverSession(
+            MineCount(total_cells=self.n_rows * self.n_cols, total_mines=self.n_mines), tally_cache=tally_cache
+        )
 
-    def place_mines(self) -> None:
-        indices: List[Tuple[int, int]] = [(r, c) for r in range(self.n_rows) for c in range(self.n_cols)]
+    @functools.cached_property
+    def neighbor_table(self) -> NeighborTable:
+        """Built on first use, as the vectorized paths don't need it; shared with the other live boards of
+        the same shape, and freed with the last of them."""
+        return shared_neighbor_table(self.n_rows, self.n_cols, self.topology)
 
-        for i, j in random.sample(indices, self.n_mines):
-            self.mines.add((i, j))
-            self.minefield[i][j]["mine_count"] = -1
-            for r in range(max(0, i - 1), min(i + 2, self.n_rows)):
-                for c in range(max(0, j - 1), min(j + 2, self.n_cols)):
-                    if self.minefield[r][c]["mine_count"] != -1:
-                        self.minefield[r][c]["mine_count"] += 1
+    def place_mines(self, safe: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Lay the mines at random, drawing from rng.
 
-    def reveal(self, i: int, j: int) -> None:
+        Args:
+            safe: keep this cell and its neighbors free of mines
+        """
+        n_cells = self.n_rows * self.n_cols
+        excluded: List[int] = []
+        if safe is not None:
+            k = safe[0] * self.n_cols + safe[1]
+            excluded = sorted([k, *self.neighbor_table.neighbors(k)])
+        if self.n_mines > n_cells - len(excluded):
+            raise ValueError("more mines than cells to put them in")
+
+        # Sample among the other cells, then shift the sample past the excluded ones. Sampling flat
+        # indices picks the same cells as sampling the row-major list of (row, col)
+        if self.array_backed:
+            generator = np.random.default_rng(self.rng.getrandbits(64))
+            flat_indices: Any = generator.choice(n_cells - len(excluded), self.n_mines, replace=False)
+            for k in excluded:
+                flat_indices[flat_indices >= k] += 1
+        else:
+            flat_indices = self.rng.sample(range(n_cells - len(excluded)), self.n_mines)
+            for k in excluded:
+                flat_indices = [m + (m >= k) for m in flat_indices]
+        self.set_mines(flat_indices)
+
+    def set_mines(self, flat_indices: Iterable[int]) -> None:
+        """
+        Lay mines at the given flat indices (row * n_cols + col), replacing any laid before, and
+        count each cell's neighboring mines. A layout that isn't n_mines distinct cells of the
+        board raises ValueError, leaving the board as it was.
+        """
+        n_cells = self.n_rows * self.n_cols
+        if self.array_backed:
+            flat = np.fromiter(flat_indices, dtype=np.intp)
+            if len(flat) and (flat.min() < 0 or flat.max() >= n_cells):
+                raise ValueError("mines must be laid on the board")
+            is_mine = np.zeros(self.shape, dtype=bool)
+            is_mine.flat[flat] = True
+            if len(flat) != self.n_mines or np.count_nonzero(is_mine) != self.n_mines:
+                raise ValueError("expected %d distinct mines" % self.n_mines)
+            self.mine_counts[...] = count_neighbors(is_mine, self.topology)
+            self.mine_counts[is_mine] = -1
+            rows, cols = np.nonzero(is_mine)
+            self.mines = set(zip(rows.tolist(), cols.tolist()))
+        else:
+            flat_indices = list(flat_indices)
+            if not all(0 <= k < n_cells for k in flat_indices):
+                raise ValueError("mines must be laid on the board")
+            if len(flat_indices) != self.n_mines or len(set(flat_indices)) != self.n_mines:
+                raise ValueError("expected %d distinct mines" % self.n_mines)
+            cells = self.flat_minefield
+            for cell in cells:
+                cell["mine_count"] = 0
+            for k in flat_indices:
+                cells[k]["mine_count"] = -1
+            for k in flat_indices:
+                for n in self.neighbor_table.neighbors(k):
+                    if cells[n]["mine_count"] != -1:
+                        cells[n]["mine_count"] += 1
+            self.mines = set(divmod(k, self.n_cols) for k in flat_indices)
+        self.mines_placed = True
+
+    def reveal(self, i: int, j: int) -> List[Tuple[int, int]]:
+        """
+        Uncover a cell, flood filling outwards (breadth first) through cells with no adjacent mines.
+
+        Returns:
+            uncovered: the cells this move uncovered, in order; empty if the move hit a mine or
+                the cell wasn't covered
+        """
         if self.game_over or self.game_won:
-            return
+            return []
+        if not self.mines_placed:
+            self.place_mines(safe=(i, j))
 
-        if self.minefield[i][j]["state"] != State.COVERED:
-            return
+        if self.array_backed:
+            states, counts = self.flat_cell_states, self.flat_mine_counts
+
+            def is_covered(k: int) -> bool:
+                return states[k] == State.COVERED
+
+            def uncover(k: int) -> None:
+                states[k] = State.UNCOVERED
+
+            def mine_count(k: int) -> int:
+                return counts[k]
+
+        else:
+            cells = self.flat_minefield
 
-        if self.minefield[i][j]["mine_count"] == -1:
+            def is_covered(k: int) -> bool:
+                return cells[k]["state"] == State.COVERED
+
+            def uncover(k: int) -> None:
+                cells[k]["state"] = State.UNCOVERED
+
+            def mine_count(k: int) -> int:
+                return cells[k]["mine_count"]
+
+        start = i * self.n_cols + j
+        if not is_covered(start):
+            return []
+
+        if mine_count(start) == -1:
             self.game_over = True
             self.reveal_all_mines()
             print("Game Over!")
-            return
-
-        # Mark this cell as uncovered
-        self.minefield[i][j]["state"] = State.UNCOVERED
-
-        # If the cell has no adjacent mines, recursively reveal neighbors
-        if self.minefield[i][j]["mine_count"] == 0:
-            for x in range(max(0, i - 1), min(i + 2, self.n_rows)):
-                for y in range(max(0, j - 1), min(j + 2, self.n_cols)):
-                    if (x, y) != (i, j) and not (self.game_over or self.game_won):
-                        self.reveal(x, y)
+            return []
+
+        # Cells are marked uncovered as they're queued, so each is queued only once
+        neighbors = self.neighbor_table.neighbors
+        uncover(start)
+        uncovered: List[int] = []
+        queue: Deque[int] = deque([start])
+        while queue:
+            k = queue.popleft()
+            uncovered.append(k)
+            # If the cell has no adjacent mines, reveal its neighbors (none of which are mines)
+            if mine_count(k) == 0:
+                for n in neighbors(k):
+                    if is_covered(n):
+                        uncover(n)
+                        queue.append(n)
+        self.n_covered -= len(uncovered)
+        self.update_frontier(uncovered)
 
         # Check if this reveal caused a win
         if self.check_win():
             self.game_won = True
             print("You won!")
-            return
+        return [divmod(k, self.n_cols) for k in uncovered]
+
+    def random_safe_reveal(self) -> List[Tuple[int, int]]:
+        """
+        Returns:
+            uncovered: the cells uncovered; see reveal()
+        """
+        if self.array_backed:
+            safe_indices = np.flatnonzero((self.cell_states == State.COVERED) & (self.mine_counts != -1))
+            if not len(safe_indices):
+                print("No safe cells to reveal.")
+                return []
+            return self.reveal(*divmod(int(self.rng.choice(safe_indices)), self.n_cols))
 
-    def random_safe_reveal(self) -> None:
         safe_cells: List[Tuple[int, int]] = [
             (i, j)
             for i in range(self.n_rows)
@@ -113,67 +545,185 @@ class Minesweeper:
 
         if not safe_cells:
             print("No safe cells to reveal.")
-            return
+            return []
 
-        i, j = random.choice(safe_cells)
-        self.reveal(i, j)
+        i, j = self.rng.choice(safe_cells)
+        return self.reveal(i, j)
 
     def reveal_all_mines(self) -> None:
-        for i, j in self.mines:
-            self.minefield[i][j]["state"] = State.UNCOVERED
+        if self.array_backed:
+            covered_mines = (self.flat_mine_counts == -1) & (self.flat_cell_states == State.COVERED)
+            uncovered: List[int] = np.flatnonzero(covered_mines).tolist()
+            self.flat_cell_states[covered_mines] = State.UNCOVERED
+        else:
+            cells = self.flat_minefield
+            uncovered = [i * self.n_cols + j for i, j in self.mines]
+            uncovered = [k for k in uncovered if cells[k]["state"] == State.COVERED]
+            for k in uncovered:
+                cells[k]["state"] = State.UNCOVERED
+        self.n_covered -= len(uncovered)
+        self.update_frontier(uncovered)
         self.game_over = True
         self.game_won = False
 
     def check_win(self) -> bool:
-        return (
-            len(
-                [
-                    (i, j)
-                    for i in range(self.n_rows)
-                    for j in range(self.n_cols)
-                    if self.minefield[i][j]["state"] != State.UNCOVERED
-                ]
-            )
-            == self.n_mines
-        )
+        return self.n_covered == self.n_mines
 
     def get_neighbors(self, i: int, j: int) -> List[Tuple[int, int]]:
-        return [
-            (x, y)
-            for x in range(max(0, i - 1), min(i + 2, self.n_rows))
-            for y in range(max(0, j - 1), min(j + 2, self.n_cols))
-            if (x, y) != (i, j)
-        ]
+        return [divmod(k, self.n_cols) for k in self.neighbor_table.neighbors(i * self.n_cols + j)]
 
-    def create_rules_from_minefield(self) -> Set[Rule]:
-        rules: Set[Rule] = set()
-        tags: Dict[Tuple[int, int], str] = {}
-        tag_generator: TagGenerator = TagGenerator()
-        self.tag_to_index: Dict[str, Tuple[int, int]] = {}
+    def tag(self, k: int) -> Union[str, int]:
+        """
+        Returns:
+            tag: the solver's id for the covered cell at flat index k, generating one if needed
+        """
+        if self.integer_ids:
+            return k
+        tag = self.tags.get(k)
+        if tag is None:
+            tag = self.tags[k] = self.tag_generator.next_tag()
+            self.tag_to_index[tag] = divmod(k, self.n_cols)
+        return tag
 
-        for i in range(self.n_rows):
-            for j in range(self.n_cols):
-                if self.minefield[i][j]["state"] == State.UNCOVERED:
-                    neighbors = self.get_neighbors(i, j)
-                    mine_count: int = self.minefield[i][j]["mine_count"]
-
-                    covered_neighbors: List[str] = []
-                    for x, y in neighbors:
-                        # Check if the neighbor is COVERED
-                        neighbor_state = self.minefield[x][y]["state"]
-                        if neighbor_state == State.COVERED:
-                            # Assign a unique tag to this neighbor if needed
-                            if (x, y) not in tags:
-                                tag: str = tag_generator.next_tag()
-                                tags[(x, y)] = tag
-                                self.tag_to_index[tag] = (x, y)
-                            covered_neighbors.append(tags[(x, y)])
-
-                    if covered_neighbors:
-                        # Create a rule like: "sum of these covered neighbors = mine_count"
-                        rules.add(Rule(mine_count, covered_neighbors))
-
-        return rules
+    def rule_at(self, k: int) -> Union[Rule, None]:
+        """
+        Returns:
+            rule: the rule the uncovered cell at flat index k imposes on its covered neighbors;
+                None if it has none, or is a mine
+        """
+        neighbors = self.neighbor_table.neighbors(k)
+        if self.array_backed:
+            mine_count = int(self.flat_mine_counts[k])
+            states = self.flat_cell_states
+            covered_neighbors = [self.tag(n) for n in neighbors if states[n] == State.COVERED]
+        else:
+            cells = self.flat_minefield
+            mine_count = cells[k]["mine_count"]
+            covered_neighbors = [self.tag(n) for n in neighbors if cells[n]["state"] == State.COVERED]
+        if mine_count == -1 or not covered_neighbors:
+            return None
+        return Rule(mine_count, covered_neighbors)
+
+    def set_frontier_rule(self, k: int, rule: Union[Rule, None]) -> None:
+        """Replace the frontier's rule for an uncovered cell (None: take it off the frontier)."""
+        old_rule = self.frontier.get(k)
+        if old_rule == rule:
+            return
+        if old_rule is not None:
+            del self.frontier[k]
+            self.rule_counts[old_rule] -= 1
+            if not self.rule_counts[old_rule]:
+                del self.rule_counts[old_rule]
+                for changed in self.changed_rules.values():
+                    changed.setdefault(old_rule, True)
+        if rule is not None:
+            self.frontier[k] = rule
+            if rule not in self.rule_counts:
+                for changed in self.changed_rules.values():
+                    changed.setdefault(rule, False)
+            self.rule_counts[rule] += 1
+
+    def update_frontier(self, uncovered: Iterable[int]) -> None:
+        """Refresh the rules of newly uncovered cells (flat indices) and of the frontier cells next
+        to them, the only ones whose covered neighbors changed."""
+        frontier = self.frontier
+        neighbors = self.neighbor_table.neighbors
+        counts = self.flat_mine_counts if self.array_backed else None
+        affected: Set[int] = set()
+        for k in uncovered:
+            # A newly uncovered 0 has no covered neighbors left, so only numbers can join
+            if (counts[k] if counts is not None else self.flat_minefield[k]["mine_count"]) > 0:
+                affected.add(k)
+            affected.update(n for n in neighbors(k) if n in frontier)
+        for k in affected:
+            self.set_frontier_rule(k, self.rule_at(k))
+
+    def rebuild_frontier(self) -> None:
+        """Recompute the frontier from a full scan of the board, after cell states were set
+        directly rather than through reveal()."""
+        frontier = self.scan_frontier()
+        for k in set(self.frontier) | set(frontier):
+            self.set_frontier_rule(k, frontier.get(k))
+
+    def rule_delta(self, consumer: str = "caller") -> Tuple[Set[Rule], Set[Rule]]:
+        """
+        A consumer's first call starts a log of the changes it has yet to read, which grows with
+        every change until the next call; one that stops reading should drop_rule_delta().
+
+        Args:
+            consumer: whose previous call to diff against; each consumer sees every change once,
+                whoever else reads the delta (the board's own solver session is "session")
+
+        Returns:
+            (added, removed): the frontier's rules gained and lost since the consumer's previous
+                call; every rule on the frontier, for its first call
+        """
+        changed = self.changed_rules.get(consumer)
+        self.changed_rules[consumer] = {}
+        if changed is None:
+            return set(self.rule_counts), set()
+        added: Set[Rule] = set()
+        removed: Set[Rule] = set()
+        for rule, was_live in changed.items():
+            if rule in self.rule_counts:
+                if not was_live:
+                    added.add(rule)
+            elif was_live:
+                removed.add(rule)
+        return added, removed
+
+    def drop_rule_delta(self, consumer: str = "caller") -> None:
+        """Stop logging changes for a consumer of rule_delta(); its next call starts over."""
+        self.changed_rules.pop(consumer, None)
+
+    def scan_frontier(self) -> Dict[int, Rule]:
+        """
+        Find the frontier by scanning the whole board, rather than reading the one reveal() keeps.
+
+        Returns:
+            frontier: uncovered number (flat index) -> its rule, for the numbers with covered
+                neighbors
+        """
+        frontier: Dict[int, Rule] = {}
+        neighbors = self.neighbor_table.neighbors
+
+        if self.array_backed:
+            # Only uncovered numbers with a covered neighbor yield a rule
+            covered = self.cell_states == State.COVERED
+            candidates = ~covered & (self.mine_counts != -1) & (count_neighbors(covered, self.topology) > 0)
+            flat_indices = np.flatnonzero(candidates)
+            mine_counts = self.flat_mine_counts[flat_indices].tolist()
+            # Plain lists index much faster than arrays do one element at a time
+            is_covered: List[bool] = covered.reshape(-1).tolist()
+            for k, mine_count in zip(flat_indices.tolist(), mine_counts):
+                covered_neighbors = [self.tag(n) for n in neighbors(k) if is_covered[n]]
+                frontier[k] = Rule(mine_count, covered_neighbors)
+            return frontier
+
+        for k, cell in enumerate(self.flat_minefield):
+            if cell["state"] == State.UNCOVERED:
+                mine_count: int = cell["mine_count"]
+                if mine_count == -1:
+                    continue
+
+                covered_neighbors: List[Union[str, int]] = []
+                for n in neighbors(k):
+                    # Check if the neighbor is COVERED
+                    if self.flat_minefield[n]["state"] == State.COVERED:
+                        covered_neighbors.append(self.tag(n))
+
+                if covered_neighbors:
+                    # Create a rule like: "sum of these covered neighbors = mine_count"
+                    frontier[k] = Rule(mine_count, covered_neighbors)
+
+        return frontier
+
+    def create_rules_from_minefield(self) -> Set[Rule]:
+        """
+        Build the rules from a full scan of the board; see scan_frontier(). reveal() keeps them
+        up to date as rule_counts, so this is only needed after setting cell states directly.
+        """
+        return set(self.scan_frontier().values())
 
     def decode_solution(
         self, solution: Dict[Union[str, None], float]
@@ -181,39 +731,109 @@ class Minesweeper:
         """
         Returns:
             decoded_solution: A dict mapping (row, col) -> probability
-            probability_array: A 2D list of floats, same shape as minefield
+            probability_array: A 2D list of floats, same shape as minefield (a float array for
+                array-backed boards); NaN for the cells a cancelled solve left open
         """
         decoded_solution: Dict[Tuple[int, int], float] = {}
 
         # 1) Determine the default value for each cell (e.g., 0.0 if solution[None] not present)
         default_prob: float = solution.get(None, 0.0)
+        if isinstance(solution, Solution) and not solution.complete:
+            default_prob = float("nan")
 
         # 2) Create a 2D list initialized with this default probability
-        probability_array: List[List[float]] = [[default_prob for _ in range(self.n_cols)] for _ in range(self.n_rows)]
+        probability_array: Any
+        if self.array_backed:
+            probability_array = np.full(self.shape, default_prob)
+        else:
+            probability_array = [[default_prob for _ in range(self.n_cols)] for _ in range(self.n_rows)]
 
         # 3) Fill in specific probabilities for tags that exist
         for tag, probability in solution.items():
-            if tag in self.tag_to_index:
+            if tag is None:
+                continue
+            if self.integer_ids:
+                i, j = divmod(tag, self.n_cols)
+            elif tag in self.tag_to_index:
                 i, j = self.tag_to_index[tag]
-                decoded_solution[(i, j)] = probability
-                probability_array[i][j] = probability
+            else:
+                continue
+            decoded_solution[(i, j)] = probability
+            probability_array[i][j] = probability
 
         return decoded_solution, probability_array
 
-    def solve_minefield(self) -> Tuple[Dict[Tuple[int, int], float], List[List[float]]]:
+    def solve_minefield_flat(
+        self, out: Union[List[float], None] = None, token: Optional[CancellationToken] = None
+    ) -> List[float]:
         """
+        Solve the board in integer-ID mode, writing the mine probability of cell (row, col)
+        into out[row * n_cols + col] without going through a per-tag dict.
+
+        Args:
+            out: flat buffer to write into
+            token: a solver.CancellationToken to stop the solve early
+
+        Returns:
+            out: the flat probability buffer (allocated if not given); if the token fired, NaN
+                except for the cells known to be safe or mines
+        """
+        assert self.integer_ids, "flat solutions require integer_ids=True"
+        if out is None:
+            out = [0.0] * (self.n_rows * self.n_cols)
+        self.update_session()
+        return self.session.solve(out=out, token=token)
+
+    def update_session(self) -> None:
+        """Feed the solver session the rules that changed since the previous solve."""
+        added, removed = self.rule_delta("session")
+        self.session.update(added=added, removed=removed)
+
+    def safe_and_mine_cells(
+        self, prove: Iterable[Tuple[int, int]] = ()
+    ) -> Tuple[Set[Tuple[int, int]], Set[Tuple[int, int]]]:
+        """
+        Find the covered cells that are certainly safe or certainly mines, skipping the
+        probability computation; see solver.solve_certain().
+
+        Args:
+            prove: cells to settle by enumeration if the cheaper deductions leave them open
+
+        Returns:
+            (safe, mines): sets of (row, col)
+        """
+        rules: Set[Rule] = set(self.rule_counts)
+        if self.integer_ids:
+            prove = [i * self.n_cols + j for i, j in prove]
+        else:
+            # cells that aren't tagged aren't in any rule
+            prove = [self.tags[i * self.n_cols + j] for i, j in prove if i * self.n_cols + j in self.tags]
+        certain: Dict[Union[str, int], float] = solve_certain(rules, prove)
+
+        safe: Set[Tuple[int, int]] = set()
+        mines: Set[Tuple[int, int]] = set()
+        for tag, probability in certain.items():
+            cell = divmod(tag, self.n_cols) if self.integer_ids else self.tag_to_index[tag]
+            (mines if probability else safe).add(cell)
+        return safe, mines
+
+    def solve_minefield(
+        self, token: Optional[CancellationToken] = None
+    ) -> Tuple[Dict[Tuple[int, int], float], List[List[float]]]:
+        """
+        Args:
+            token: a solver.CancellationToken to stop the solve early; if it fires, only the cells
+                known to be safe or mines so far are solved (see decode_solution())
+
         Returns:
             (decoded_solution, probability_array):
             - decoded_solution: dict of (row, col) -> probability
             - probability_array: 2D list of probabilities
         """
-        rules: Set[Rule] = self.create_rules_from_minefield()
-        total_cells: int = self.n_rows * self.n_cols
+        self.update_session()
 
-        # 'solve' is presumably an external function that returns a dict like {tag: probability, ...}
-        results: dict[str | None, float] | dict[str, float] = solve(
-            rules, MineCount(total_cells=total_cells, total_mines=self.n_mines)
-        )
+        # 'solve' returns a dict like {tag: probability, ...}
+        results: dict[str | None, float] | dict[str, float] = self.session.solve(token=token)
         return self.decode_solution(results)
 
 
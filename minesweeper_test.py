@@ -1,5 +1,9 @@
 import unittest
+import unittest.mock
 import collections
+import gc
+import itertools
+import random
 import re
 from solver import *
 
@@ -200,6 +204,10 @@ class Test(unittest.TestCase):
             reduce_rules([R("3:a,b,c,d"), R("3:c,d,e")]),
             set([R("1:a,b"), R("1:c"), R("1:d"), R("1:e")]),
         )
+        # once 'abc' is reduced by 'a', its queued reduction by 'b' is stale
+        rr = RuleReducer()
+        self.assertEqual(reduce_rules([R("2:a,b,c"), R("1:a"), R("1:b")], rr), set([R("1:a"), R("1:b"), R("0:c")]))
+        self.assertEqual(rr.stats, collections.Counter(queued=3, popped=3, stale=1))
 
     def test_permute(self):
         pset = lambda r: PermutationSet.from_rule(r).permus
@@ -269,6 +277,48 @@ class Test(unittest.TestCase):
         self.assertEqual(P("ab0def1ghij0k1").multiplicity(), 3)
         self.assertEqual(P("ab0def1ghij2k1").multiplicity(), 18)
 
+    def test_cached_immutables(self):
+        import pickle
+
+        rule = R("2:abc,de")
+        self.assertFalse(hasattr(rule, "__dict__"))
+        self.assertEqual(hash(rule), hash(rule._canonical()))
+        self.assertEqual(pickle.loads(pickle.dumps(rule)), rule)
+        self.assertNotIn("_hash", pickle.dumps(rule).decode("latin-1"))
+        self.assertEqual(P("a1b0"), P("b0a1"))
+        self.assertNotEqual(P("a1b0"), P("a0b1"))
+        self.assertNotEqual(Reduceable(rule, R("1:abc")), Reduceable(R("1:abc"), rule))
+
+        self.assertIs(R("2:abc,de").interned(), rule.interned())
+        with unittest.mock.patch("solver.INTERN_IMMUTABLES", True):
+            self.assertIs(R("2:abc,de,f").subtract(R("0:f")), rule.interned())
+            self.assertIs(next(R("0:f").permute()), next(R("0:f").permute()))
+
+    def test_cell_index(self):
+        index = CellIndex(R("0:abc,de,f,ghi").cells_)
+        pack = index.pack
+        mask = lambda s: index.mask(R("0:%s" % s).cells_)
+
+        for p in ("abc2de1f0ghi3", "abc0de0f0ghi0", "abc3de2f1ghi1"):
+            self.assertEqual(index.unpack(pack(P(p))), P(p))
+            self.assertEqual(pack(P(p)).bit_count(), P(p).k())
+            self.assertEqual(index.multiplicity(pack(P(p))), P(p).multiplicity())
+        self.assertEqual(index.unpack(pack(P("abc2de1")), mask("abc,de")), P("abc2de1"))
+        self.assertEqual(pack(P("abc2de1f0")) & mask("abc,de"), pack(P("abc2de1")))
+        self.assertEqual(pack(P("abc2de1")) | pack(P("de1ghi2")), pack(P("abc2de1ghi2")))
+
+        overlap = lambda a, b: index.mask(P(a).cells() & P(b).cells())
+        compatible = lambda a, b: not (pack(P(a)) ^ pack(P(b))) & overlap(a, b)
+        self.assertTrue(compatible("abc2de1f0", "abc2de1ghi2"))
+        self.assertFalse(compatible("abc1de1f0", "abc2de1ghi2"))
+        self.assertTrue(compatible("f0", "ghi3"))
+
+        # compatible permutations land in the same projection bucket
+        buckets = CellIndex.project(map(pack, [P("abc2de1"), P("abc2de0"), P("abc1de1")]), mask("de"))
+        self.assertEqual(
+            dict(buckets), {pack(P("de1")): set(map(pack, [P("abc2de1"), P("abc1de1")])), 0: set([pack(P("abc2de0"))])}
+        )
+
     def test_permutationset_decompose(self):
         _ = lambda it: set(ps._immutable() for ps in it)
 
@@ -331,6 +381,16 @@ class Test(unittest.TestCase):
                 pset.remove(p)
         self.assertEqual(_(pset.decompose()), _([subset1, subset2]))
 
+        # cells of a 2-of-4 rule are pairwise independent, but the rule doesn't factor
+        pset = PermutationSet.from_rule(R("3:a,b,c,d,e,f"))
+        for p in list(pset.permus):
+            if p.subset(set_([set_("e"), set_("f")])).k() != 1:
+                pset.remove(p)
+        self.assertEqual(
+            _(pset.decompose()),
+            _([PermutationSet.from_rule(R("2:a,b,c,d")), PermutationSet.from_rule(R("1:e,f"))]),
+        )
+
     def test_ruleset_cross_eliminate_and_rereduce(self):
         def compare(rules, output, rereduced=None):
             _ = lambda prs: set(set_(ps.permus) for ps in prs.permu_map.values())
@@ -426,6 +486,11 @@ class Test(unittest.TestCase):
         self.assertRaises(InconsistencyError, lambda: prs.cross_eliminate())
         prs = PermutedRuleset([R("1:a,b,c,d"), R("3:b,c,d,e")])
         self.assertRaises(InconsistencyError, lambda: prs.cross_eliminate())
+        # eliminations cascade down the chain, one pass per link
+        prs = PermutedRuleset(set([R("2:a,b"), R("1:b,c"), R("1:c,d"), R("1:d,e")]))
+        self.assertEqual(prs.cross_eliminate(), [1, 1, 1])
+        self.assertEqual(prs.eliminated, [1, 1, 1])
+        self.assertEqual(set(prs.permu_map[R("1:d,e")].permus), set([P("d1e0")]))
         # more complex re-reductions
         compare(
             [R("2:a,b,c,d"), R("1:a,b,x"), R("1:c,d,y")],
@@ -500,7 +565,620 @@ class Test(unittest.TestCase):
             ),
         )
 
-    # enumerate
+    def test_enumerate(self):
+        prs = permute_and_interfere(set([R("1:a,b,c"), R("1:c,d,e"), R("2:a,b,x,y")]))
+        (front,) = [f for f in prs.split_fronts() if not f.is_trivial()]
+        self.assertEqual(
+            set(front.enumerate()),
+            set(
+                [
+                    P("a1b0c0d1e0x1y0"),
+                    P("a1b0c0d0e1x1y0"),
+                    P("a0b1c0d1e0x1y0"),
+                    P("a0b1c0d0e1x1y0"),
+                    P("a1b0c0d1e0x0y1"),
+                    P("a1b0c0d0e1x0y1"),
+                    P("a0b1c0d1e0x0y1"),
+                    P("a0b1c0d0e1x0y1"),
+                    P("a0b0c1d0e0x1y1"),
+                ]
+            ),
+        )
+
+        # search is done in place; everything is rolled back once it finishes
+        state = EnumerationState(front)
+        free = list(state.free)
+        self.assertEqual(len(list(state.enumerate())), 9)
+        self.assertEqual((state.fixed, state.trail), ([], []))
+        self.assertTrue(all(a is b for a, b in zip(state.free, free)))
+
+        # branching strategies only change the shape of the search
+        for branching in BRANCHING_STRATEGIES:
+            state = EnumerationState(front, branching)
+            self.assertEqual(set(map(front.cell_index.unpack, state.enumerate())), set(front.enumerate()))
+            self.assertGreaterEqual(state.nodes, 9 + state.dead_ends)
+        # mrv starts with (one of) the rules with the fewest permutations
+        state = EnumerationState(front, "mrv")
+        self.assertEqual(len(state.free[state.next_rule()]), min(len(p) for p in state.free))
+
+        # counting without generating configurations gives the same raw tally
+        expected = collections.defaultdict(FrontSubtally)
+        for config in front.enumerate():
+            expected[config.k()].add(config)
+        state = EnumerationState(front)
+        counted = state.count().subtallies
+        self.assertEqual(set(counted), set(expected))
+        for k, subtally in expected.items():
+            self.assertEqual(counted[k].total, subtally.total)
+            self.assertEqual(dict(counted[k].tally), dict(subtally.tally))
+        self.assertEqual((state.fixed, state.trail), ([], []))
+
+    def test_solve_integer_cells(self):
+        # 3x3 board, one mine; top-left '1' uncovered
+        rules = set([Rule(1, [1, 3, 4])])
+        mine_count = MineCount(total_cells=9, total_mines=1)
+        solution = solve(rules, mine_count)
+        out = solve(rules, mine_count, out=[-1.0] * 9)
+        self.assertEqual(len(out), 9)
+        for cell in (1, 3, 4):
+            self.assertAlmostEqual(out[cell], solution[cell])
+            self.assertAlmostEqual(out[cell], 1.0 / 3)
+        for cell in (0, 2, 5, 6, 7, 8):
+            self.assertAlmostEqual(out[cell], solution[None])
+            self.assertAlmostEqual(out[cell], 0.0)
+
+    def test_solver_session(self):
+        def check(session):
+            expected = solve(set(session.rules), session.mine_prevalence)
+            solution = session.solve()
+            self.assertEqual(set(solution), set(expected))
+            for cell, p in expected.items():
+                self.assertAlmostEqual(solution[cell], p)
+
+        session = SolverSession(MineCount(total_cells=30, total_mines=6))
+        front1 = [r("1:a,b,c"), r("1:c,d,e"), r("2:a,b,x,y")]
+        front2 = [r("2:m,n,o"), r("1:n,o,p")]
+        session.update(added=front1 + front2)
+        check(session)
+        self.assertEqual(session.stats["components_solved"], 2)
+
+        # only the touched component is re-solved
+        session.update(added=[r("1:p,q")])
+        check(session)
+        self.assertEqual(session.stats["components_solved"], 3)
+        self.assertEqual(session.stats["components_reused"], 1)
+
+        session.update(added=[r("0:e")], removed=[r("1:c,d,e")])
+        check(session)
+        self.assertEqual(session.stats["components_solved"], 5)
+        self.assertEqual(session.stats["components_reused"], 2)
+
+    def test_front_tally_cache(self):
+        def front(rules):
+            prs = permute_and_interfere(set(rules))
+            (f,) = [f for f in prs.split_fronts() if not f.is_trivial()]
+            return f
+
+        def tally_data(tally):
+            return dict((k, (st.total, dict(st.tally))) for k, st in tally)
+
+        cache = FrontTallyCache(maxsize=2)
+        f1 = front([R("1:a,b,c"), R("1:c,d,e"), R("2:a,b,x,y")])
+        # same structure, different cell names
+        f2 = front([R("2:p,q,m,n"), R("1:r,s,t"), R("1:m,n,r")])
+        self.assertEqual(canonical_front(f1)[0], canonical_front(f2)[0])
+        self.assertNotEqual(canonical_front(f1)[0], canonical_front(front([R("1:a,b,c"), R("1:c,d,e")]))[0])
+
+        self.assertEqual(tally_data(cache.tally(f1)), tally_data(enumerate_front(f1)))
+        self.assertEqual(tally_data(cache.tally(f2)), tally_data(enumerate_front(f2)))
+        self.assertEqual(cache.stats(), {"size": 1, "maxsize": 2, "hits": 1, "misses": 1})
+
+        cache.tally(front([R("1:a,b,c"), R("1:c,d,e")]))
+        cache.tally(front([R("1:a,b,c"), R("2:c,d,e")]))
+        self.assertEqual(len(cache), 2)
+        cache.tally(f2)
+        self.assertEqual(cache.misses, 4)
+
+    def test_parallel_fronts(self):
+        import pickle
+        from concurrent.futures import ThreadPoolExecutor
+
+        rules = [R("1:a,b,c"), R("1:c,d,e"), R("2:a,b,x,y"), R("2:m,n,o"), R("1:n,o,p")]
+        fronts = [f for f in permute_and_interfere(set(rules)).split_fronts() if not f.is_trivial()]
+        expected = [dict((k, (st.total, dict(st.tally))) for k, st in enumerate_front(f)) for f in fronts]
+
+        # fronts travel to workers as plain tuples
+        key, cells = canonical_front(fronts[0])
+        self.assertEqual(pickle.loads(pickle.dumps(key)), key)
+        self.assertEqual(
+            unpack_tally(enumerate_front_key(key), cells).subtallies.keys(), enumerate_front(fronts[0]).subtallies.keys()
+        )
+
+        with ThreadPoolExecutor(2) as executor:
+            for min_size in (1, 10**9):
+                with unittest.mock.patch("solver.PARALLEL_MIN_FRONT_SIZE", min_size):
+                    tallies = tally_fronts(fronts, executor=executor)
+                self.assertEqual([dict((k, (st.total, dict(st.tally))) for k, st in t) for t in tallies], expected)
+
+    def test_tree_decomposition(self):
+        # a chain of rules, with supercells and a rule that can't tell its cells apart
+        rules = [R("1:a,b,c"), R("1:c,d,e"), R("2:e,fg,h"), R("1:h,i,j"), R("1:j,k"), R("2:a,b,x,y")]
+        (front,) = [f for f in permute_and_interfere(set(rules)).split_fronts() if not f.is_trivial()]
+        tree = TreeDecomposition(front)
+        # every rule gets a bag; rules overlapping each other share one
+        self.assertEqual(sorted(tree.order), list(range(len(front.permu_map))))
+        self.assertTrue(all(len(tree.bag(rule)) <= 3 for rule in tree.order))
+
+        tally = lambda t: dict((k, (st.total, dict(st.tally))) for k, st in t)
+        expected = tally(enumerate_front(front))
+        counted = tree.count()
+        counted.finalize()
+        self.assertEqual(tally(counted), expected)
+
+        # chosen automatically for big enough fronts
+        with unittest.mock.patch("solver.TREE_MIN_FRONT_SIZE", 1):
+            with unittest.mock.patch("solver.EnumerationState", side_effect=AssertionError):
+                self.assertEqual(tally(enumerate_front(front)), expected)
+
+    def test_solve_approx(self):
+        rules = set([Rule(1, ["a", "b", "c"]), Rule(1, ["c", "d", "e"]), Rule(2, ["a", "b", "x", "y"])])
+        mine_count = MineCount(total_cells=20, total_mines=4)
+        expected = solve(rules, mine_count)
+
+        # small fronts are counted exactly
+        solution = solve(rules, mine_count, mode="approx")
+        self.assertTrue(solution.exact)
+        self.assertEqual(solution, expected)
+        self.assertEqual(solution.intervals["a"], (expected["a"], expected["a"]))
+
+        with unittest.mock.patch("solver.APPROX_MIN_COST", 0):
+            # a budget that runs out before sampling even starts stops the solve like a cancellation
+            solution = solve(rules, mine_count, mode="approx", budget_ms=0, rng=random.Random(0))
+            self.assertFalse(solution.complete)
+            self.assertLessEqual(set(solution), set(expected))
+
+            # a fixed # of samples makes the result depend on the seed alone; compare on seeded positions
+            import benchmark
+            inside = total = 0
+            error = 0.0
+            for rules, mine_count in benchmark.sample_boards(3, 0.15, "hard", 0, integer_ids=True):
+                expected = solve(rules, mine_count)
+                solution = solve(rules, mine_count, mode="approx", samples=200, rng=random.Random(0))
+                again = solve(rules, mine_count, mode="approx", samples=200, rng=random.Random(0))
+                self.assertFalse(solution.exact)
+                self.assertEqual(set(solution), set(expected))
+                for cell, p in expected.items():
+                    self.assertAlmostEqual(again[cell], solution[cell])
+                    lo, hi = solution.intervals[cell]
+                    self.assertTrue(lo <= solution[cell] <= hi)
+                    error += abs(solution[cell] - p)
+                    inside += lo - 1e-9 <= p <= hi + 1e-9
+                    total += 1
+            self.assertLess(error / total, 0.02)
+            self.assertGreater(inside, 0.9 * total)
+
+        self.assertRaises(ValueError, lambda: solve(rules, mine_count, mode="approx", out=[]))
+        self.assertRaises(ValueError, lambda: solve(rules, mine_count, mode="fast"))
+
+    def test_solve_cancellation(self):
+        # 'z' is safe; the rest is a front that must be enumerated
+        rules = set([Rule(0, ["z", "a"]), Rule(1, ["a", "b", "c"]), Rule(1, ["c", "d", "e"]), Rule(2, ["b", "x", "y"])])
+        mine_count = MineCount(total_cells=20, total_mines=4)
+        expected = solve(rules, mine_count)
+
+        class Countdown(CancellationToken):
+            """a token that fires after a given # of polls"""
+
+            def __init__(self, polls):
+                super().__init__()
+                self.polls = polls
+
+            def cancelled(self):
+                self.polls -= 1
+                return self.polls < 0 or super().cancelled()
+
+        # cancel at every possible point: the result is either complete, or
+        # holds only certain cells
+        partial = set()
+        for polls in itertools.count():
+            solution = solve(rules, mine_count, token=Countdown(polls))
+            if not isinstance(solution, Solution):
+                self.assertEqual(solution, expected)
+                break
+            self.assertFalse(solution.complete)
+            self.assertTrue(all(p in (0.0, 1.0) and expected[cell] == p for cell, p in solution.items()))
+            partial.add(frozenset(solution))
+        # certain cells are found before the front is enumerated
+        self.assertIn(frozenset(["z", "a"]), partial)
+
+        # the incremental path stops the same way, and picks up where it left off
+        for polls in itertools.count():
+            session = SolverSession(mine_count)
+            session.update(added=rules)
+            solution = session.solve(token=Countdown(polls))
+            if not isinstance(solution, Solution):
+                break
+            self.assertFalse(solution.complete)
+            resumed = session.solve()
+            for cell, p in expected.items():
+                self.assertAlmostEqual(resumed[cell], p)
+        # a cancelled session still reports the certain cells of the components it already solved
+        session = SolverSession(MineCount(total_cells=21, total_mines=4))
+        session.update(added=[Rule(0, ["q"])])
+        session.solve()
+        session.update(added=rules)
+        self.assertEqual(session.solve(token=CancellationToken(timeout_ms=0)), {"q": 0.0})
+
+        # with a buffer, a cancelled solve still writes into it: NaN, but for the certain cells
+        int_rules = set([Rule(0, [9, 0]), Rule(1, [0, 1, 2]), Rule(1, [2, 3, 4]), Rule(2, [1, 5, 6])])
+        flat = solve(int_rules, mine_count, out=[0.0] * 20)
+        for polls in itertools.count():
+            buf = [0.5] * 20
+            self.assertIs(solve(int_rules, mine_count, out=buf, token=Countdown(polls)), buf)
+            if not any(p != p for p in buf):
+                self.assertEqual(buf, flat)
+                break
+            self.assertTrue(all(p != p or (p in (0.0, 1.0) and flat[k] == p) for k, p in enumerate(buf)))
+        session = SolverSession(MineCount(total_cells=21, total_mines=4))
+        session.update(added=[Rule(0, [20])])
+        session.solve()
+        session.update(added=int_rules)
+        buf = [0.5] * 21
+        self.assertIs(session.solve(out=buf, token=CancellationToken(timeout_ms=0)), buf)
+        self.assertEqual(buf[20], 0.0)
+        self.assertTrue(all(p != p for p in buf[:20]))
+
+        # sampling polls the token before every sample
+        with unittest.mock.patch("solver.APPROX_MIN_COST", 0):
+            token = Countdown(10**9)
+            solution = solve(rules, mine_count, mode="approx", samples=50, rng=random.Random(0), token=token)
+            self.assertGreaterEqual(10**9 - token.polls, solution.samples)
+
+        # an expired deadline stops the solve before it does anything
+        self.assertFalse(solve(rules, mine_count, token=CancellationToken(timeout_ms=0)).complete)
+        token = CancellationToken()
+        token.cancel()
+        self.assertRaises(Cancelled, lambda: list(EnumerationState(permute_and_interfere(set([R("1:a,b")])), token=token).enumerate()))
+
+        # the engine's solves take a token too; cells it left open come back as NaN
+        import game_engine
+
+        board = game_engine.Minesweeper("intermediate", seed=4)
+        with unittest.mock.patch("builtins.print"):
+            board.random_safe_reveal()
+        decoded, probabilities = board.solve_minefield(token=token)
+        self.assertTrue(all(p in (0.0, 1.0) for p in decoded.values()))
+        open_cells = [(i, j) for i in range(board.n_rows) for j in range(board.n_cols) if (i, j) not in decoded]
+        self.assertTrue(open_cells)
+        self.assertTrue(all(probabilities[i][j] != probabilities[i][j] for i, j in open_cells))
+        _, probabilities = board.solve_minefield()
+        self.assertTrue(all(p == p for row in probabilities for p in row))
+
+    def test_solve_certain(self):
+        # logical deduction settles a, b (safe) and c (mine)
+        rules = set([Rule(0, ["a", "b"]), Rule(1, ["b", "c"]), Rule(1, ["c", "d", "e"])])
+        self.assertEqual(solve_certain(rules), {"a": 0.0, "b": 0.0, "c": 1.0, "d": 0.0, "e": 0.0})
+
+        # AY is safe, but only the front as a whole shows it
+        rules = set(
+            [
+                Rule(1, ["AL", "AO", "AP", "AQ", "AR"]),
+                Rule(1, ["AL", "AO", "X"]),
+                Rule(1, ["AM", "AN", "AY"]),
+                Rule(1, ["AN", "AY", "BO"]),
+                Rule(1, ["AQ", "AR", "AZ"]),
+                Rule(1, ["AR", "AZ", "BP"]),
+                Rule(1, ["AY", "BO", "BV", "BW", "BX"]),
+                Rule(1, ["AZ", "BP", "BX", "BY", "BZ"]),
+                Rule(1, ["BW", "BX", "BY"]),
+                Rule(1, ["Q", "R", "S", "T", "U", "V", "W", "X"]),
+                Rule(2, ["AL", "AM", "AN", "W", "X"]),
+            ]
+        )
+        expected = solve(rules, MineCount(total_cells=100, total_mines=20))
+        certain = solve_certain(rules)
+        self.assertNotIn("AY", certain)
+        self.assertTrue(all(expected[cell] == p for cell, p in certain.items()))
+        proved = solve_certain(rules, prove=["AY", "AL"])
+        self.assertEqual(proved["AY"], expected["AY"])
+        self.assertEqual(proved["AY"], 0.0)
+        self.assertNotIn("AL", proved)
+
+    def test_cell_probabilities(self):
+        rules = set([Rule(1, ["a", "b"]), Rule(1, ["b", "c", "d"]), Rule(0, ["e"])])
+        mine_prevalence = MineCount(total_cells=10, total_mines=3)
+        expected = solve(rules, mine_prevalence, "x")
+        lazy = solve(rules, mine_prevalence, "x", lazy=True)
+        self.assertEqual(lazy.to_dict(), expected)
+        self.assertEqual(lazy.probs(["d", "a", "x", "z"]), [expected["d"], expected["a"], expected["x"], expected["x"]])
+        self.assertEqual(lazy.prob("e"), 0.0)
+        self.assertEqual(lazy.argmin(), ("e", 0.0))
+        self.assertEqual(lazy.argmin(["a", "b", "x"]), min([(c, expected[c]) for c in "abx"], key=lambda e: e[1]))
+
+        # no 'other' cells to fall back on
+        lazy = solve(set([Rule(1, ["a", "b"])]), MineCount(total_cells=2, total_mines=1), lazy=True)
+        self.assertEqual(lazy.prob("a"), 0.5)
+        self.assertRaises(KeyError, lambda: lazy.prob("z"))
+        self.assertRaises(ValueError, lambda: solve(rules, mine_prevalence, lazy=True, out={}))
+
+        # single-cell queries go through an index built on first use
+        lazy = solve(rules, mine_prevalence, "x", lazy=True)
+        self.assertIsNone(lazy.index)
+        self.assertEqual([lazy.prob(c) for c in "daxz"], [expected["d"], expected["a"], expected["x"], expected["x"]])
+        self.assertIsNotNone(lazy.index)
+        self.assertEqual(lazy.probs(["d", "z"]), [expected["d"], expected["x"]])
+
+        # the 'other' cells have no name to return
+        lazy = solve(set([Rule(2, ["a", "b"])]), MineCount(total_cells=10, total_mines=3), lazy=True)
+        self.assertRaises(ValueError, lazy.argmin)
+        self.assertEqual(lazy.argmin(["a", "q"]), ("q", 0.125))
+        session = SolverSession(mine_prevalence)
+        session.update(added=rules)
+        self.assertRaises(ValueError, lambda: session.solve(lazy=True, out=[]))
+
+    def test_reveal_flood_fill(self):
+        import game_engine
+
+        # far deeper than the recursion limit if filled recursively
+        random.seed(0)
+        board = game_engine.Minesweeper(None, rows=200, columns=200, mines=1)
+        (mine,) = board.mines
+        safe = next(cell for cell in [(0, 0), (199, 199)] if max(abs(a - b) for a, b in zip(cell, mine)) > 1)
+        with unittest.mock.patch("builtins.print"):
+            uncovered = board.reveal(*safe)
+        self.assertEqual(uncovered[0], safe)
+        self.assertEqual(len(set(uncovered)), 200 * 200 - 1)
+        self.assertTrue(board.game_won and board.check_win())
+        self.assertEqual(board.reveal(*safe), [])
+
+        random.seed(1)
+        board = game_engine.Minesweeper("intermediate")
+        with unittest.mock.patch("builtins.print"):
+            while not board.game_won:
+                uncovered = board.random_safe_reveal()
+                self.assertTrue(uncovered)
+                self.assertTrue(all(board.minefield[i][j]["state"] == game_engine.State.UNCOVERED for i, j in uncovered))
+                covered = sum(cell["state"] == game_engine.State.COVERED for row in board.minefield for cell in row)
+                self.assertEqual(board.n_covered, covered)
+            self.assertEqual(board.reveal(*next(iter(board.mines))), [])
+
+    def test_frontier_rule_delta(self):
+        import game_engine
+
+        random.seed(2)
+        board = game_engine.Minesweeper("intermediate")
+        rules = set()
+        with unittest.mock.patch("builtins.print"):
+            for _ in range(5):
+                board.random_safe_reveal()
+                self.assertEqual(board.frontier, board.scan_frontier())
+                added, removed = board.rule_delta()
+                self.assertFalse(added & rules)
+                self.assertLessEqual(removed, rules)
+                rules = (rules - removed) | added
+                self.assertEqual(rules, board.create_rules_from_minefield())
+        self.assertEqual(board.rule_delta(), (set(), set()))
+
+        # states set behind reveal()'s back
+        x, y = next(
+            (x, y)
+            for k in board.frontier
+            for x, y in board.get_neighbors(*divmod(k, board.n_cols))
+            if board.minefield[x][y]["state"] == game_engine.State.COVERED and (x, y) not in board.mines
+        )
+        board.minefield[x][y]["state"] = game_engine.State.UNCOVERED
+        self.assertNotEqual(board.frontier, board.scan_frontier())
+        board.rebuild_frontier()
+        self.assertEqual(board.frontier, board.scan_frontier())
+        added, removed = board.rule_delta()
+        self.assertEqual((rules - removed) | added, board.create_rules_from_minefield())
+
+        # a consumer that stops reading stops being logged for
+        board.drop_rule_delta()
+        self.assertEqual(list(board.changed_rules), [])
+        with unittest.mock.patch("builtins.print"):
+            board.random_safe_reveal()
+        self.assertEqual(list(board.changed_rules), [])
+        self.assertEqual(board.rule_delta(), (board.create_rules_from_minefield(), set()))
+
+        # reading the delta doesn't take it from the board's own solver session
+        board = game_engine.Minesweeper("intermediate", seed=4)
+        with unittest.mock.patch("builtins.print"):
+            board.random_safe_reveal()
+            board.solve_minefield()
+            board.random_safe_reveal()
+        board.rule_delta()
+        solution, _ = board.solve_minefield()
+        expected, _ = board.decode_solution(
+            solve(board.create_rules_from_minefield(), MineCount(board.n_rows * board.n_cols, board.n_mines))
+        )
+        self.assertEqual(set(solution), set(expected))
+        for cell, p in expected.items():
+            self.assertAlmostEqual(solution[cell], p)
+
+    def test_board_topologies(self):
+        import game_engine
+
+        def neighbors(topology, i, j, shape=(4, 5)):
+            table = game_engine.shared_neighbor_table(*shape, game_engine.topologies[topology])
+            return sorted(divmod(k, shape[1]) for k in table.neighbors(i * shape[1] + j))
+
+        self.assertEqual(neighbors("square", 0, 0), [(0, 1), (1, 0), (1, 1)])
+        self.assertEqual(neighbors("torus", 0, 0), [(0, 1), (0, 4), (1, 0), (1, 1), (1, 4), (3, 0), (3, 1), (3, 4)])
+        self.assertEqual(neighbors("hex", 1, 1), [(0, 1), (0, 2), (1, 0), (1, 2), (2, 1), (2, 2)])
+        self.assertEqual(neighbors("hex", 2, 1), [(1, 0), (1, 1), (2, 0), (2, 2), (3, 0), (3, 1)])
+        self.assertRaises(ValueError, lambda: game_engine.Minesweeper(None, rows=2, columns=9, mines=1, topology="torus"))
+
+        for topology in game_engine.topologies:
+            random.seed(4)
+            board = game_engine.Minesweeper("intermediate", topology=topology)
+            for i, j in itertools.product(range(board.n_rows), range(board.n_cols)):
+                if (i, j) not in board.mines:
+                    mines = sum(cell in board.mines for cell in board.get_neighbors(i, j))
+                    self.assertEqual(board.minefield[i][j]["mine_count"], mines)
+            with unittest.mock.patch("builtins.print"):
+                for _ in range(5):
+                    board.random_safe_reveal()
+            self.assertEqual(board.frontier, board.scan_frontier())
+
+        # the numpy build matches the plain one; tables are shared between live boards only
+        if game_engine.np is not None:
+            for topology, shape in itertools.product(game_engine.topologies.values(), [(4, 5), (6, 3), (1, 6)]):
+                if shape == (1, 6) and topology.wrap:
+                    continue
+                table = game_engine.NeighborTable(*shape, topology)
+                with unittest.mock.patch.object(game_engine, "np", None):
+                    plain = game_engine.NeighborTable(*shape, topology)
+                self.assertEqual((table.offsets, table.indices), (plain.offsets, plain.indices))
+        boards = [game_engine.Minesweeper(None, rows=7, columns=11, mines=5) for _ in range(2)]
+        self.assertIs(boards[0].neighbor_table, boards[1].neighbor_table)
+        del boards
+        gc.collect()
+        self.assertNotIn((7, 11, game_engine.topologies["square"]), game_engine.neighbor_tables)
+
+    def test_array_backed_board(self):
+        import game_engine
+
+        self.assertRaises(ValueError, lambda: game_engine.Minesweeper(None, rows=10, columns=10))
+        if game_engine.np is None:
+            self.skipTest("numpy not installed")
+
+        # array-backed boards draw their layout from numpy, so lay the same mines on both
+        lists = game_engine.Minesweeper("intermediate", seed=3)
+        arrays = game_engine.Minesweeper("intermediate", array_backed=True)
+        arrays.set_mines(i * arrays.n_cols + j for i, j in lists.mines)
+        self.assertEqual(arrays.mines, lists.mines)
+        self.assertEqual([[dict(cell) for cell in row] for row in arrays.minefield], lists.minefield)
+
+        for k in range(4):
+            for board in (lists, arrays):
+                board.rng = random.Random(k)
+                board.random_safe_reveal()
+            self.assertEqual([[dict(cell) for cell in row] for row in arrays.minefield], lists.minefield)
+            self.assertEqual(arrays.create_rules_from_minefield(), lists.create_rules_from_minefield())
+            self.assertEqual(arrays.check_win(), lists.check_win())
+
+        # writes through the view land in the arrays
+        i, j = next(iter(arrays.mines))
+        arrays.minefield[i][j]["state"] = game_engine.State.UNCOVERED
+        self.assertEqual(arrays.cell_states[i, j], game_engine.State.UNCOVERED)
+        self.assertEqual(arrays.minefield[-1][-1], lists.minefield[-1][-1])
+
+        # the vectorized neighbor counts agree with the neighbor table
+        for topology in ("torus", "hex"):
+            lists = game_engine.Minesweeper("easy", topology=topology, seed=5)
+            arrays = game_engine.Minesweeper("easy", array_backed=True, topology=topology)
+            arrays.set_mines(i * arrays.n_cols + j for i, j in lists.mines)
+            self.assertEqual([[dict(cell) for cell in row] for row in arrays.minefield], lists.minefield)
+
+        big = game_engine.Minesweeper(None, array_backed=True, rows=200, columns=300, mines=5000)
+        self.assertEqual((big.mine_counts == -1).sum(), 5000)
+        self.assertEqual(big.mine_counts.dtype, game_engine.np.int8)
+
+    def test_seeded_first_click_safe(self):
+        import game_engine
+
+        for array_backed in (False, True):
+            if array_backed and game_engine.np is None:
+                continue
+            boards = [game_engine.Minesweeper("hard", array_backed=array_backed, seed=11) for _ in range(2)]
+            self.assertEqual(boards[0].mines, boards[1].mines)
+            self.assertEqual(len(boards[0].mines), boards[0].n_mines)
+            with unittest.mock.patch("builtins.print"):
+                self.assertEqual(boards[0].random_safe_reveal(), boards[1].random_safe_reveal())
+
+            # nothing is laid until the first reveal, which lands on an opening
+            board = game_engine.Minesweeper("hard", array_backed=array_backed, seed=7, first_click_safe=True)
+            self.assertFalse(board.mines_placed)
+            with unittest.mock.patch("builtins.print"):
+                uncovered = board.reveal(0, 0)
+            self.assertEqual(len(board.mines), board.n_mines)
+            self.assertFalse(board.mines & {(0, 0), (0, 1), (1, 0), (1, 1)})
+            self.assertGreater(len(uncovered), 1)
+            self.assertFalse(board.game_over)
+
+            # every other cell can still hold a mine
+            board = game_engine.Minesweeper(None, array_backed=array_backed, rows=5, columns=5, mines=16, first_click_safe=True)
+            with unittest.mock.patch("builtins.print"):
+                board.reveal(2, 2)
+            self.assertEqual(board.mines, set((i, j) for i in range(5) for j in range(5) if max(abs(i - 2), abs(j - 2)) == 2))
+            # ... and more than that is refused up front
+            self.assertRaises(
+                ValueError,
+                lambda: game_engine.Minesweeper(
+                    None, array_backed=array_backed, rows=5, columns=5, mines=17, first_click_safe=True
+                ),
+            )
+
+            # a bad layout leaves the board as it was
+            board = game_engine.Minesweeper(None, array_backed=array_backed, rows=5, columns=5, mines=3, seed=1)
+            before = ([[dict(cell) for cell in row] for row in board.minefield], set(board.mines))
+            for layout in ([0, 1], [0, 1, 1], [0, 1, 25], [-1, 0, 1], [0, 1, 2, 3]):
+                self.assertRaises(ValueError, lambda: board.set_mines(layout))
+                self.assertEqual(([[dict(cell) for cell in row] for row in board.minefield], board.mines), before)
+
+    def test_combine_fronts(self):
+        self.assertEqual(convolve((1, [1.0, 2.0]), (0, [3.0, 0.0, 1.0]), 10), (1, [3.0, 6.0, 1.0, 2.0]))
+        self.assertEqual(convolve((1, [1.0, 2.0]), (0, [3.0, 0.0, 1.0]), 2), (1, [3.0, 6.0]))
+
+        def tally(totals):
+            return FrontTally(dict((k, FrontSubtally.mk(total, {})) for k, total in totals.items()))
+
+        fronts = [tally({1: 2.0, 2: 3.0}), tally({0: 1.0, 2: 5.0})]
+        other = combine_fronts(fronts, 4, 4)
+
+        # brute force: weight of each combination is the product of the counts,
+        # times (4 choose # mines in 'other') relative to (4 choose max 'other' mines)
+        expected = [collections.defaultdict(float) for _ in range(3)]
+        for (a, ca), (b, cb) in itertools.product({1: 2.0, 2: 3.0}.items(), {0: 1.0, 2: 5.0}.items()):
+            n = 4 - a - b
+            if 0 <= n <= 4:
+                w = ca * cb * choose(4, n) / choose(4, 3)
+                for e, k in zip(expected, (a, b, n)):
+                    e[k] += w
+        # weights come out relative to each other within a front
+        def normalized(t):
+            total = sum(st.total for _, st in t)
+            return dict((k, st.total / total) for k, st in t)
+
+        for t, e in zip(fronts + [other], expected):
+            self.assertEqual(set(k for k, st in t if st.total), set(e))
+            for k, p in normalized(t).items():
+                self.assertAlmostEqual(p, e.get(k, 0.0) / sum(e.values()))
+
+        # exact counts past the float range weigh the same as their scaled-down floats
+        scale = 10**400
+        huge = [tally({1: 2 * scale, 2: 3 * scale}), tally({0: scale, 2: 5 * scale})]
+        combine_fronts(huge, 4, 4)
+        for t, e in zip(huge, expected):
+            for k, p in normalized(t).items():
+                self.assertAlmostEqual(p, e.get(k, 0.0) / sum(e.values()))
+
+        # a long chain of rules, each with a private block: its configuration count (~1e327) passes the float range
+        n, k, m = 30, 60, 10
+        rules = set(Rule(m, ["c%d" % i, "c%d" % (i + 1)] + ["p%d_%d" % (i, j) for j in range(k)]) for i in range(n))
+        mine_count = MineCount(total_cells=(n + 1) + n * k + 100, total_mines=n * m + 20)
+        solution = solve(rules, mine_count)
+        self.assertAlmostEqual(sum(solution[c] for c in solution if c is not None) + 100 * solution[None], n * m + 20)
+        # the end of the chain is in one rule, like the private cells
+        self.assertAlmostEqual(solution["c0"], solution["p0_0"])
+
+    def test_combinatorics(self):
+        import combinatorics
+        import math
+        for n in (0, 1, 5, 64, 65, 200):
+            for k in (-1, 0, 1, n // 2, n, n + 1):
+                self.assertEqual(combinatorics.choose(n, k), math.comb(n, k) if 0 <= k <= n else 0)
+                if 0 <= k <= n:
+                    self.assertAlmostEqual(combinatorics.log_choose(n, k), math.log(math.comb(n, k)))
+        self.assertEqual(combinatorics.log_choose(5, 6), -math.inf)
+        self.assertEqual(combinatorics.fact_div(7, 4), 210)
+        self.assertAlmostEqual(combinatorics.fact_div(4, 7), 1 / 210.)
+        self.assertLessEqual(combinatorics.tables.binomial.cache_info().currsize, combinatorics.tables.max_memo)
+
+        # would overflow a float if computed from the raw binomials
+        self.assertAlmostEqual(discrete_relative_likelihood(3000, 1001, 1000), 2000 / 1001.)
+
     # trivial front?
 
     def test_uncharted_cell(self):
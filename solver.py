@@ -1,13 +1,17 @@
 from __future__ import annotations
-import queue
+import math
+import time
+import heapq
+import random
 import operator
 import itertools
 import collections
+import concurrent.futures
+import combinatorics
 from util import *
-from queue import PriorityQueue
 from itertools import chain
 from functools import reduce
-from typing import Any, Set, Dict, List, Self, Tuple, Union, Iterator, Optional
+from typing import Any, Set, Dict, List, Self, Tuple, Union, Callable, Iterable, Iterator, Optional
 
 
 set_ = frozenset
@@ -19,6 +23,60 @@ class InconsistencyError(Exception):
     pass
 
 
+class Cancelled(Exception):
+    """raise when a solve is stopped by its CancellationToken."""
+
+    pass
+
+
+class CancellationToken(object):
+    """cooperative cancellation for a solve: the solver polls the token in
+    its inner loops and gives up (raising Cancelled) once it's been
+    cancel()ed -- e.g., from another thread -- or its deadline has passed"""
+
+    def __init__(self, timeout_ms: Optional[float] = None) -> None:
+        """timeout_ms -- if given, the token cancels itself this long after
+        being created"""
+        # time.monotonic() value past which the token is cancelled, if any
+        self.deadline: Optional[float] = None if timeout_ms is None else time.monotonic() + timeout_ms / 1000.0
+        self.is_cancelled = False
+
+    def cancel(self) -> None:
+        self.is_cancelled = True
+
+    def cancelled(self) -> bool:
+        """return whether the solve should stop"""
+        if not self.is_cancelled and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.is_cancelled = True
+        return self.is_cancelled
+
+    def check(self) -> None:
+        """raise Cancelled if the solve should stop"""
+        if self.cancelled():
+            raise Cancelled()
+
+    def remaining(self) -> Optional[float]:
+        """seconds left until the deadline (None if there is none)"""
+        return None if self.deadline is None else max(self.deadline - time.monotonic(), 0.0)
+
+
+class LinkedToken(CancellationToken):
+    """a token with a deadline of its own that also fires when its parent
+    does, e.g. to bound one phase of a solve the caller may cancel outright"""
+
+    def __init__(self, deadline: float, parent: Optional[CancellationToken] = None) -> None:
+        """deadline -- a time.monotonic() value
+        parent -- token of the enclosing solve, if any"""
+        super().__init__()
+        self.deadline = deadline
+        self.parent = parent
+
+    def cancelled(self) -> bool:
+        if self.parent is not None and self.parent.cancelled():
+            self.is_cancelled = True
+        return super().cancelled()
+
+
 """represents the board geometry for traditional minesweeper, where the board
 has fixed dimensions and fixed total # of mines.
 
@@ -28,6 +86,17 @@ total_mines: total # of mines contained within all cells
 """
 MineCount = collections.namedtuple("MineCount", ["total_cells", "total_mines"])
 
+# share equal Rule_s and Permutations as they're generated, rather than
+# letting each derivation hold its own copy (see interned()). off by default:
+# within a single solve, equal copies rarely outlive the set that dedupes them
+INTERN_IMMUTABLES = False
+
+
+def interned(obj: CachedImmutableMixin) -> Any:
+    """return the shared instance equal to 'obj' if INTERN_IMMUTABLES is set,
+    else 'obj' itself"""
+    return obj.interned() if INTERN_IMMUTABLES else obj
+
 
 class Rule(ImmutableMixin):
     """basic representation of an axiom from a minesweeper game: N mines
@@ -66,9 +135,11 @@ class Rule(ImmutableMixin):
         )
 
 
-class Permutation(ImmutableMixin):
+class Permutation(CachedImmutableMixin):
     """a single permutation of N mines among a set of (super)cells"""
 
+    __slots__ = ("mapping",)
+
     def __init__(self, mapping: Union[Dict[frozenset, int], Iterator, Set[Tuple[frozenset, int]]]) -> None:
         """mapping -- a mapping: supercell -> # of mines therein
 
@@ -115,12 +186,93 @@ class Permutation(ImmutableMixin):
     def _canonical(self) -> Tuple[Tuple[frozenset, int], ...]:
         return tuple(sorted(iter(self.mapping.items()), key=lambda k_v: hash(k_v[0])))
 
+    def _equivalent(self, o: Self) -> bool:
+        # dict equality ignores order; no need to sort
+        return self.mapping == o.mapping
+
     def __repr__(self):
         cell_counts = sorted([(sorted(list(cell)), count) for cell, count in self.mapping.items()])
         cell_frags = ["%s:%d" % (",".join(str(c) for c in cell), count) for cell, count in cell_counts]
         return "{%s}" % " ".join(cell_frags)
 
 
+class CellIndex(object):
+    """compact, bit-packed encoding of permutations over a fixed set of
+    supercells (typically those of a single front)
+
+    each supercell gets a dense index and a bit field as wide as the
+    supercell; N mines in the supercell are stored in unary as the N low bits
+    of its field. a permutation is then a plain int, and with 'mask' the OR
+    of the fields of the cells it covers:
+
+    compatible -- not ((a ^ b) & mask_a & mask_b), i.e., equal projections
+      onto the shared cells (see project())
+    combine -- a | b
+    subset -- a & mask
+    k -- popcount
+    """
+
+    def __init__(self, cells_: Iterable[frozenset]) -> None:
+        # supercells, in index order
+        self.cells = list(cells_)
+        # mapping: supercell -> dense index
+        self.index: Dict[frozenset, int] = {}
+        # bit offset / field mask of each supercell, by index
+        self.offsets: List[int] = []
+        self.masks: List[int] = []
+        # multiplicities[i][n]: # of ways to place n mines in supercell i
+        self.multiplicities: List[List[int]] = []
+
+        offset = 0
+        for i, cell_ in enumerate(self.cells):
+            self.index[cell_] = i
+            self.offsets.append(offset)
+            self.masks.append(((1 << len(cell_)) - 1) << offset)
+            self.multiplicities.append([choose(len(cell_), n) for n in range(len(cell_) + 1)])
+            offset += len(cell_)
+        self.full_mask = (1 << offset) - 1
+
+    def mask(self, cells_: Iterable[frozenset]) -> int:
+        """return the combined field mask of a set of supercells"""
+        return reduce(operator.or_, (self.masks[self.index[cell_]] for cell_ in cells_), 0)
+
+    def pack(self, permu: Permutation) -> int:
+        """encode a Permutation as an int"""
+        value = 0
+        for cell_, n in permu.mapping.items():
+            value |= ((1 << n) - 1) << self.offsets[self.index[cell_]]
+        return value
+
+    def unpack(self, value: int, mask: Optional[int] = None) -> Permutation:
+        """decode an int back into a Permutation over the cells in 'mask'
+        (default: all cells)"""
+        mask = self.full_mask if mask is None else mask
+        return Permutation(
+            (cell_, (value & field).bit_count()) for cell_, field in zip(self.cells, self.masks) if mask & field
+        )
+
+    def counts(self, value: int) -> Iterator[Tuple[frozenset, int]]:
+        """return (supercell, # mines) for every cell in the index"""
+        for cell_, field in zip(self.cells, self.masks):
+            yield (cell_, (value & field).bit_count())
+
+    @staticmethod
+    def project(values: Iterable[int], mask: int) -> Dict[int, Set[int]]:
+        """bucket packed permutations by their projection onto the cells in
+        'mask'. with 'mask' the cells shared by two rules, the permutations of
+        one rule compatible with a permutation 'p' of the other are exactly
+        the bucket for 'p & mask' -- found in one hashing pass rather than by
+        testing every pair"""
+        buckets = collections.defaultdict(set)
+        for value in values:
+            buckets[value & mask].add(value)
+        return buckets
+
+    def multiplicity(self, value: int) -> float:
+        """see Permutation.multiplicity(); 'value' must cover all cells"""
+        return product(mults[(value & field).bit_count()] for field, mults in zip(self.masks, self.multiplicities))
+
+
 class UnchartedCell(ImmutableMixin):
     """a meta-cell object that represents all the 'other' cells on the board
     that aren't explicitly mentioned in a rule. see expand_cells()"""
@@ -144,7 +296,7 @@ class UnchartedCell(ImmutableMixin):
         return (self.size,)
 
 
-class Rule_(ImmutableMixin):
+class Rule_(CachedImmutableMixin):
     """analogue of 'Rule', but containing supercells (sets of 'ordinary' cells
     that only ever appear together).
 
@@ -155,6 +307,8 @@ class Rule_(ImmutableMixin):
     cells_ -- set of supercells; each supercell a set of base cells
     """
 
+    __slots__ = ("num_mines", "cells_", "num_cells")
+
     def __init__(
         self,
         num_mines: int,
@@ -174,7 +328,7 @@ class Rule_(ImmutableMixin):
         if self.num_mines == 0 or self.num_mines == self.num_cells:
             for cell_ in self.cells_:
                 size = len(cell_)
-                yield Rule_(size if self.num_mines > 0 else 0, set_([cell_]), size)
+                yield interned(Rule_(size if self.num_mines > 0 else 0, set_([cell_]), size))
             # degenerate rules (no cells) disappear here
         else:
             yield self
@@ -182,10 +336,12 @@ class Rule_(ImmutableMixin):
     def subtract(self, subrule: Rule_) -> Rule_:
         """if another rule is a sub-rule of this one, return a new rule
         covering only the difference"""
-        return Rule_(
-            self.num_mines - subrule.num_mines,
-            self.cells_ - subrule.cells_,
-            self.num_cells - subrule.num_cells,
+        return interned(
+            Rule_(
+                self.num_mines - subrule.num_mines,
+                self.cells_ - subrule.cells_,
+                self.num_cells - subrule.num_cells,
+            )
         )
 
     def permute(self) -> Iterator[Permutation]:
@@ -250,41 +406,90 @@ class PermutedRuleset(object):
         self.rules = rules
         self.cell_rules_map = CellRulesMap(rules)
         self.cells_ = self.cell_rules_map.cells_()
+        # bit-packed encoding of this ruleset's permutations
+        self.cell_index = CellIndex(self.cells_)
 
         def rule_permuset(r: Rule_) -> PermutationSet | Self:
             return PermutationSet.from_rule(r) if permu_map is None else permu_map[r]
 
         # a mapping: rule -> PermutationSet for that rule
         self.permu_map = dict((rule, rule_permuset(rule)) for rule in rules)
+        # of permutations removed by each pass of the last cross_eliminate()
+        self.eliminated: List[int] = []
 
-    def cross_eliminate(self) -> None:
+    def cross_eliminate(self, token: Optional[CancellationToken] = None) -> List[int]:
         """determine what permutations are possible for each rule, taking
         into account the constraints of all overlapping rules. eliminate
-        impossible permutations"""
-
-        interferences = self.cell_rules_map.interference_edges()
-
-        # we can't simply iterate through 'interferences', as eliminating a
-        # permutation in a rule may in turn invalidate permutations in other
-        # overlapping rules that have already been processed, thus causing a
-        # cascade effect
-        while interferences:
-            r, r_ov = interferences.pop()
-            changed = False
-            for permu in list(self.permu_map[r]):  # copy iterable so we can modify original
-                if self.permu_map[r_ov].compatible(permu).empty():
-                    # this permutation has no compatible permutation in the overlapping
-                    # rule. thus, it can never occur
-                    self.permu_map[r].remove(permu)
-                    changed = True
-
-            if self.permu_map[r].empty():
-                # no possible configurations for this rule remain
-                raise InconsistencyError("rule is constrained such that it has no valid mine permutations")
-            elif changed:
-                # other rules overlapping with this one must be recalculated
-                for r_other in self.cell_rules_map.overlapping_rules(r):
-                    interferences.add((r_other, r))
+        impossible permutations
+
+        this enforces arc consistency by support counting (in the manner of
+        AC-2001): for each pair of overlapping rules, we count how many
+        permutations of one rule project onto each configuration of the
+        shared cells. a permutation of the other rule is possible only while
+        the count for its own projection is non-zero, so removing a
+        permutation only ever revisits the permutations whose support just
+        ran out
+
+        returns the # of permutations eliminated by each pass: first those
+        unsupported from the outset, then each successive wave of
+        eliminations that they set off (also kept in 'eliminated')
+
+        token -- polled once per rule pair / eliminated permutation"""
+
+        rules = list(self.rules)
+        rule_ids = dict((rule, i) for i, rule in enumerate(rules))
+        # mapping: rule id -> (packed permutation -> Permutation)
+        packed = [self.packed_permus(rule) for rule in rules]
+        masks = [self.cell_index.mask(rule.cells_) for rule in rules]
+        neighbors = [[rule_ids[r] for r in self.cell_rules_map.overlapping_rules(rule)] for rule in rules]
+
+        # for each pair of overlapping rules (a, b) -- b being the i-th
+        # neighbor of a -- keyed by projection onto their shared cells:
+        # support[a][i] -- # of b's permutations with that projection
+        # dependents[a][i] -- a's remaining permutations with that projection;
+        #   only built once a's support from b first runs out somewhere
+        overlaps = [[masks[a] & masks[b] for b in a_neighbors] for a, a_neighbors in enumerate(neighbors)]
+        support = [[None] * len(a_neighbors) for a_neighbors in neighbors]
+        dependents = [[None] * len(a_neighbors) for a_neighbors in neighbors]
+        # position of a among the neighbors of its i-th neighbor
+        back = [[neighbors[b].index(a) for b in a_neighbors] for a, a_neighbors in enumerate(neighbors)]
+
+        # permutations with no compatible permutation in some overlapping rule
+        wave = set()
+        for a, a_neighbors in enumerate(neighbors):
+            for i, (b, overlap) in enumerate(zip(a_neighbors, overlaps[a])):
+                if token is not None:
+                    token.check()
+                counts = support[a][i] = collections.Counter(value & overlap for value in packed[b])
+                wave.update((a, value) for value in packed[a] if value & overlap not in counts)
+
+        self.eliminated = []
+        while wave:
+            for a, value in wave:
+                # this permutation can never occur
+                self.permu_map[rules[a]].remove(packed[a].pop(value))
+            for a, _ in wave:
+                if not packed[a]:
+                    # no possible configurations for this rule remain
+                    raise InconsistencyError("rule is constrained such that it has no valid mine permutations")
+            self.eliminated.append(len(wave))
+
+            # withdraw the removed permutations' support from overlapping rules
+            next_wave = set()
+            for a, value in wave:
+                if token is not None:
+                    token.check()
+                for b, j in zip(neighbors[a], back[a]):
+                    projection = value & overlaps[b][j]
+                    counts = support[b][j]
+                    counts[projection] -= 1
+                    if not counts[projection]:
+                        if dependents[b][j] is None:
+                            dependents[b][j] = CellIndex.project(packed[b], overlaps[b][j])
+                        next_wave.update((b, v) for v in dependents[b][j][projection] if v in packed[b])
+            wave = next_wave
+
+        return self.eliminated
 
     def rereduce(self) -> None:
         """after computing the possible permutations of the rules, analyze and
@@ -321,6 +526,11 @@ class PermutedRuleset(object):
         for permu_set in list(decompositions.values()):
             self.add_permu_set(permu_set)
 
+    def packed_permus(self, rule: Rule_) -> Dict[int, Permutation]:
+        """return a mapping: packed permutation -> Permutation, for all
+        permutations of 'rule'"""
+        return dict((self.cell_index.pack(permu), permu) for permu in self.permu_map[rule])
+
     def remove_rule(self, rule: Rule_) -> None:
         self.rules.remove(rule)
         self.cell_rules_map.remove_rule(rule)
@@ -359,7 +569,7 @@ class PermutedRuleset(object):
     def enumerate(self) -> Iterator[Permutation]:
         """enumerate all possible mine configurations for this ruleset"""
         for mineconfig in EnumerationState(self).enumerate():
-            yield mineconfig
+            yield self.cell_index.unpack(mineconfig)
 
     def __repr__(self):
         import pprint
@@ -375,16 +585,28 @@ class FrontTally(object):
         self.subtallies = collections.defaultdict(FrontSubtally) if data is None else data
         self.total = None
 
-    def tally(self, front: PermutedRuleset) -> None:
+    def tally(self, front: PermutedRuleset, token: Optional[CancellationToken] = None) -> None:
         """tally all possible configurations for a front (ruleset)
 
         note that the tallies for different total # of mines must be
         maintained separately, as these will be given different statistical
         weights later on
+
+        large fronts are counted by tree decomposition instead of being
+        enumerated (see TreeDecomposition)
         """
 
-        for config in front.enumerate():
-            self.subtallies[config.k()].add(config)
+        tree = None
+        if front_size(front) >= TREE_MIN_FRONT_SIZE:
+            tree = TreeDecomposition(front)
+            if tree.cost() >= front_size(front):
+                # bags are too wide to beat enumeration
+                tree = None
+
+        if tree is not None:
+            self.subtallies = tree.count(token).subtallies
+        else:
+            self.subtallies = EnumerationState(front, token=token).count().subtallies
 
         if not self.subtallies:
             # front has no possible configurations
@@ -420,9 +642,24 @@ class FrontTally(object):
         across all sub-tallies is 1."""
         total = sum(subtally.total for subtally in list(self.subtallies.values()))
         for subtally in list(self.subtallies.values()):
-            subtally.total /= float(total)
+            subtally.total /= total
             subtally.normalized = True
 
+    def rescale(self, lo: Optional[int] = None, hi: Optional[int] = None) -> None:
+        """divide the sub-tally totals by the largest of them, leaving floats
+        in [0, 1]. exact counts (ints) can be too large to convert to a float,
+        but int / int division isn't; only their ratios matter to the
+        weighting
+
+        lo, hi -- if given, only sub-tallies for # of mines in this range can
+            carry weight: scale by the largest among them and zero the rest,
+            so the feasible ones don't underflow next to infeasible giants"""
+        lo = self.min_mines() if lo is None else lo
+        hi = self.max_mines() if hi is None else hi
+        top = max((subtally.total for num_mines, subtally in self if lo <= num_mines <= hi), default=0)
+        for num_mines, subtally in self:
+            subtally.total = subtally.total / top if top and lo <= num_mines <= hi else 0.0
+
     def collapse(
         self,
     ) -> Iterator[
@@ -447,6 +684,13 @@ class FrontTally(object):
         for num_mines, subtally in self:
             subtally.total *= scalefunc(num_mines)
 
+    def copy(self) -> FrontTally:
+        """return a copy of this (finalized) tally whose weights can be
+        changed independently of the original; per-cell data is shared"""
+        return FrontTally(
+            dict((num_mines, FrontSubtally.mk(subtally.total, subtally.tally)) for num_mines, subtally in self)
+        )
+
     def update_weights(self, weights: dict[int, float] | dict[int, int]) -> None:
         """update each sub-tally's weight/total
 
@@ -484,11 +728,13 @@ class FrontTally(object):
         return str(dict(self.subtallies))
 
 
-class Reduceable(ImmutableMixin):
+class Reduceable(CachedImmutableMixin):
     """during the logical deduction phase, if all rules are nodes in a graph,
     this represents a directed edge in that graph indicating 'superrule' can
     be reduced by 'subrule'"""
 
+    __slots__ = ("superrule", "subrule")
+
     def __init__(self, superrule: Rule_, subrule: Rule_) -> None:
         self.superrule = superrule
         self.subrule = subrule
@@ -608,8 +854,17 @@ class RuleReducer(object):
         self.active_rules: Set[Rule_] = set()
         # reverse lookup for rules containing a given cell
         self.cell_rules_map = CellRulesMap()
-        # current list of all possible reductions
-        self.candidate_reductions: PriorityQueue = PriorityQueue()
+        # current list of all possible reductions; a heap of
+        # (priority, sequence #, superrule serial, subrule serial, Reduceable)
+        self.candidate_reductions: List[Tuple[Tuple, int, int, int, Reduceable]] = []
+        # version stamps: each rule gets a fresh serial # whenever it's added
+        # mapping: active rule -> serial #
+        self.serials: Dict[Rule_, int] = {}
+        # serial #s of the active rules
+        self.live: Set[int] = set()
+        self.counter = itertools.count()
+        # 'queued', 'popped', and 'stale' (popped, but no longer applicable) reductions
+        self.stats: collections.Counter = collections.Counter()
 
     def add_rules(self, rules: List[Rule_]) -> None:
         """add a set of rules to the ruleset"""
@@ -623,14 +878,21 @@ class RuleReducer(object):
 
     def add_base_rule(self, rule: Rule_) -> None:
         """helper for adding a rule"""
+        if rule in self.active_rules:
+            return
         self.active_rules.add(rule)
+        serial = self.serials[rule] = next(self.counter)
+        self.live.add(serial)
         self.cell_rules_map.add_rule(rule)
         self.update_reduceables(rule)
 
     def add_reduceable(self, reduc: Reduceable) -> None:
-        # priority queue priorities are lowest first
+        # heap priorities are lowest first; the sequence # breaks ties (so
+        # Reduceables themselves are never compared) in insertion order
         prio = tuple(-k for k in reduc.metric())
-        self.candidate_reductions.put((prio, reduc))
+        entry = (prio, next(self.counter), self.serials[reduc.superrule], self.serials[reduc.subrule], reduc)
+        heapq.heappush(self.candidate_reductions, entry)
+        self.stats["queued"] += 1
 
     def update_reduceables(self, rule: Rule_) -> None:
         """update the index of which rules are reduceable from others"""
@@ -646,15 +908,18 @@ class RuleReducer(object):
         """remove a rule from the active ruleset/index, presumably because it
         was reduced"""
         self.active_rules.remove(rule)
+        self.live.remove(self.serials.pop(rule))
         self.cell_rules_map.remove_rule(rule)
-        # we can't remove the inner contents of candidate_reductions queue; items
-        # are checked for validity when they're popped
+        # we can't remove the inner contents of candidate_reductions heap; items
+        # are checked for validity (by serial #) when they're popped
 
     def pop_best_reduction(self) -> Reduceable | None:
         """get the highest-value reduction to perform next"""
-        while not self.candidate_reductions.empty():
-            reduction = self.candidate_reductions.get()[1]
-            if not reduction.contained_within(self.active_rules):
+        while self.candidate_reductions:
+            _, _, super_serial, sub_serial, reduction = heapq.heappop(self.candidate_reductions)
+            self.stats["popped"] += 1
+            if super_serial not in self.live or sub_serial not in self.live:
+                self.stats["stale"] += 1
                 continue
             return reduction
         return None
@@ -665,9 +930,14 @@ class RuleReducer(object):
         self.remove_rule(reduction.superrule)
         self.add_rule(reduced_rule)
 
-    def reduce_all(self) -> Set[Rule_]:
-        """run the manager"""
+    def reduce_all(self, token: Optional[CancellationToken] = None) -> Set[Rule_]:
+        """run the manager
+
+        token -- polled before each reduction; on cancellation, the active
+          rules are left as reduced so far"""
         while True:
+            if token is not None:
+                token.check()
             reduction = self.pop_best_reduction()
             if not reduction:
                 break
@@ -694,11 +964,11 @@ def permute(
         permu = set()
 
     if count == 0:
-        yield Permutation(permu_add(*[(cell, 0) for cell in cells]))
+        yield interned(Permutation(permu_add(*[(cell, 0) for cell in cells])))
     else:
         remaining_size = sum(len(cell) for cell in cells)
         if remaining_size == count:
-            yield Permutation(permu_add(*[(cell, len(cell)) for cell in cells]))
+            yield interned(Permutation(permu_add(*[(cell, len(cell)) for cell in cells])))
         elif remaining_size >= count:
             cell = cells[0]
             for multiplicity in range(min(count, len(cell)), -1, -1):
@@ -785,143 +1055,290 @@ class PermutationSet(object):
         full permu-sets decompose to themselves"""
         return self._decompose() if self.constrained else [self]
 
-    def _decompose(self, k_floor: int = 1) -> List[PermutationSet]:
+    def _decompose(self) -> List[PermutationSet]:
         """determine if the permutation set is the cartesian product of N
         smaller permutation sets; return the decomposition if so
 
         this set may be constrained, in which case at least one subset of the
         decomposition (if one exists) will also be constrained
-        """
-        for _k in range(k_floor, int(0.5 * len(self.cells_)) + 1):
-            for cell_subset in (set_(c) for c in itertools.combinations(self.cells_, _k)):
-                try:
-                    permu_subset, permu_remainder = self.split(cell_subset)
-                except ValueError:
-                    continue
-
-                # lo, a cartesian divisor!
-                divisors = [permu_subset]
-                divisors.extend(permu_remainder._decompose(_k))
-                return divisors
-
-        return [self]
-
-    def split(self, cell_subset: frozenset) -> Tuple[PermutationSet, PermutationSet]:
-        """helper function for decompose(). given a subset of cells, return
-        the two permutation sets for the subset and the set of remaining
-        cells, provided cell_subset is a valid decomposor; raise exception if
-        not"""
-        cell_remainder = self.cells_ - cell_subset
-        permu_subset = self.subset(cell_subset)
-        # exception thrown if subset cannot be a cartesian divisor; i.e., set
-        # of permutations could not have originated from single 'choose'
-        # operation
-
-        # get the remaining permutation sets for each sub-permutation
-        permu_remainders = set(
-            map_reduce(
-                self.permus,
-                emitfunc=lambda p: [(p.subset(cell_subset), p)],
-                reducefunc=lambda pv: set_(p.subset(cell_remainder) for p in pv),
-            ).values()
-        )
-        if len(permu_remainders) > 1:
-            # remaining subsets are not identical for each sub-permutation; not
-            # a cartesian divisor
-            raise ValueError()
-        permu_remainders = permu_remainders.pop()
 
-        return (
-            permu_subset,
-            PermutationSet(cell_remainder, self.k - permu_subset.k, permu_remainders),
-        )
+        the finest decomposition is unique, and cells in different factors of
+        it are independent of each other. so first group together cells that
+        are dependent pairwise; typically those groups are exactly the
+        factors. pairwise independence doesn't imply independence, though, so
+        if the set doesn't factor over the groups, grow each factor from a
+        seed group instead (see below)
+        """
+        cells = list(self.cells_)
+        # permutations as tuples of mine counts, in 'cells' order
+        rows = [tuple(p.mapping[cell_] for cell_ in cells) for p in self.permus]
+
+        def num_projected(groups: Iterable[Tuple[int, ...]]) -> int:
+            """# of distinct permutations of the cells in 'groups' (of cell
+            indexes)"""
+            getter = operator.itemgetter(*itertools.chain(*groups))
+            return len(set(getter(row) for row in rows))
+
+        def dependent(a: List[Tuple[int, ...]], b: List[Tuple[int, ...]]) -> bool:
+            """whether the cells of 'a' and 'b' are (jointly) dependent"""
+            return num_projected(a + b) < num_projected(a) * num_projected(b)
+
+        # connected components of the pairwise-dependence graph
+        components = dict((i, [i]) for i in range(len(cells)))
+        for i, j in itertools.combinations(range(len(cells)), 2):
+            if components[i] is not components[j] and dependent([(i,)], [(j,)]):
+                merged = components[i] + components[j]
+                for m in merged:
+                    components[m] = merged
+        groups = list(set(tuple(c) for c in components.values()))
+
+        if product(num_projected([g]) for g in groups) == len(rows):
+            factors = groups
+        else:
+            # if a factor containing 'block' has yet to be completed, 'block'
+            # depends on the remaining groups. then every group in a minimal
+            # subset of them that 'block' depends on must belong to that same
+            # factor, and such a subset is found just by discarding groups one
+            # at a time (dependence is monotonic)
+            factors = []
+            remaining = groups
+            while remaining:
+                block, rest = [remaining[0]], remaining[1:]
+                while rest and dependent(block, rest):
+                    linked = list(rest)
+                    for g in rest:
+                        trial = [h for h in linked if h != g]
+                        if trial and dependent(block, trial):
+                            linked = trial
+                    block += linked
+                    rest = [g for g in rest if g not in linked]
+                factors.append(tuple(itertools.chain(*block)))
+                remaining = rest
+
+        if len(factors) == 1:
+            return [self]
+        return [self.subset(set_(cells[i] for i in f)) for f in sorted(factors, key=len)]
 
     def __repr__(self):
         return str(list(self.permus))
 
 
+def branch_arbitrary(state: EnumerationState) -> int:
+    """branching strategy: the lowest-numbered open rule, i.e., whichever
+    comes first"""
+    return next(rule for rule, permus in enumerate(state.free) if permus is not None)
+
+
+def branch_mrv(state: EnumerationState) -> int:
+    """branching strategy ('minimum remaining values'): the open rule with the
+    fewest permutations left, which keeps the branching factor low and finds
+    conflicts early"""
+    best, best_size = None, None
+    for rule, permus in enumerate(state.free):
+        if permus is not None and (best_size is None or len(permus) < best_size):
+            best, best_size = rule, len(permus)
+            if best_size == 1:
+                # can't do better
+                break
+    return best
+
+
+def branch_degree(state: EnumerationState) -> int:
+    """branching strategy: the open rule overlapping the most other open
+    rules, which constrains the rest of the front the most. ties go to the
+    rule with the fewest permutations left"""
+    free = state.free
+    return max(
+        (rule for rule, permus in enumerate(free) if permus is not None),
+        key=lambda rule: (
+            sum(1 for r in state.overlapping_rules(rule) if free[r] is not None),
+            -len(free[rule]),
+        ),
+    )
+
+
+# mapping: name -> branching strategy; a strategy picks the open rule of an
+# EnumerationState to branch on next
+BRANCHING_STRATEGIES: Dict[str, Callable[[EnumerationState], int]] = {
+    "arbitrary": branch_arbitrary,
+    "mrv": branch_mrv,
+    "degree": branch_degree,
+}
+DEFAULT_BRANCHING = "mrv"
+
+
+def owned_cells(front: PermutedRuleset, rules: List[Rule_]) -> List[List[int]]:
+    """assign every supercell of a front to the lowest-numbered rule
+    containing it, so that a configuration's mines and multiplicity are sums
+    and products of per-rule terms
+
+    rules -- the front's rules, numbered by position
+    return -- mapping: rule id -> indexes (see CellIndex) of the cells it owns"""
+    index = front.cell_index
+    owners = [None] * len(index.cells)
+    for rule_id in reversed(range(len(rules))):
+        for cell_ in rules[rule_id].cells_:
+            owners[index.index[cell_]] = rule_id
+    owned = [[] for _ in rules]
+    for i, rule_id in enumerate(owners):
+        owned[rule_id].append(i)
+    return owned
+
+
+def tabulate_marginals(
+    index: CellIndex,
+    owned: List[List[int]],
+    totals: Dict[int, int],
+    marginals: Dict[int, Dict[int, Dict[int, int]]],
+) -> FrontTally:
+    """build a (non-finalized) front tally from per-rule marginals
+
+    totals -- mapping: # mines -> # of configurations with that many mines
+    marginals -- mapping: rule id -> (packed permutation -> (# mines -> # of
+      configurations with that many mines where the rule takes that
+      permutation))"""
+    tally = FrontTally()
+    for k, weight in totals.items():
+        if weight:
+            subtally = tally.subtallies[k]
+            subtally.total = weight
+            for cell_ in index.cells:
+                subtally.tally[cell_] = 0
+    for rule, marginal in marginals.items():
+        for i in owned[rule]:
+            cell_, field = index.cells[i], index.masks[i]
+            for permu, counts in marginal.items():
+                n = (permu & field).bit_count()
+                if n:
+                    for k, weight in counts.items():
+                        if weight:
+                            tally.subtallies[k].tally[cell_] += n * weight
+    return tally
+
+
 class EnumerationState(object):
     """a helper object to enumerate through all possible mine configurations of
-    a ruleset"""
+    a ruleset
 
-    def __init__(self, ruleset: Optional[PermutedRuleset] = None) -> None:
-        """
-        ruleset -- None when cloning an existing state
-        """
-        if ruleset is None:
-            # 'naked' object for cloning
-            return
+    works entirely on the ruleset's bit-packed permutations (see CellIndex);
+    rules are referred to by dense integer ids
 
-        # set of Permutations -- one per rule -- that have been 'fixed' for
-        # the current configuration-in-progress
-        self.fixed: Set = set()
-        # subset of ruleset whose permutations are still 'open'
-        self.free = dict((rule, set(permu_set)) for rule, permu_set in ruleset.permu_map.items())
+    the search is done in place: 'fixing' a permutation narrows the open
+    permutation sets destructively, logging each overwritten set to an undo
+    trail. backtracking rolls the trail back to a saved mark, so no state is
+    copied per branch"""
 
+    def __init__(
+        self,
+        ruleset: PermutedRuleset,
+        branching: Union[str, Callable] = DEFAULT_BRANCHING,
+        token: Optional[CancellationToken] = None,
+    ) -> None:
+        """
+        branching -- strategy (or name of one in BRANCHING_STRATEGIES) used to
+          pick the rule to branch on at each node of the search
+        token -- polled at every node of the search
+        """
+        rules = list(ruleset.permu_map)
+        rule_ids = dict((rule, i) for i, rule in enumerate(rules))
+        index = ruleset.cell_index
+
+        # stack of packed permutations -- one per rule -- that have been 'fixed'
+        # for the current configuration-in-progress, and the rules they're for
+        self.fixed: List[int] = []
+        self.fixed_rules: List[int] = []
+        # permutations still 'open' for each rule
+        # mapping: rule id -> set of packed permutations; None once the rule is fixed
+        # (the sets themselves are never mutated, only replaced)
+        self.free: List[Optional[Set[int]]] = [set(ruleset.packed_permus(rule)) for rule in rules]
+        # undo log of (rule id, overwritten entry in 'free')
+        self.trail: List[Tuple[int, Optional[Set[int]]]] = []
+        if isinstance(branching, str):
+            branching = BRANCHING_STRATEGIES[branching]
+        self.branching: Callable[[EnumerationState], int] = branching
+        self.token = token
+        # of search nodes visited (permutations fixed by branching)
+        self.nodes: int = 0
+        # of those nodes that turned out to be conflicts
+        self.dead_ends: int = 0
+
+        neighbors = [[rule_ids[r] for r in ruleset.cell_rules_map.overlapping_rules(rule)] for rule in rules]
         # helper function (closure)
-        self.overlapping_rules = lambda rule: ruleset.cell_rules_map.overlapping_rules(rule)
+        self.overlapping_rules = lambda rule: neighbors[rule]
         # index for constraining overlapping permutations
-        # mapping: (permutation, overlapping rule) -> PermutationSet of valid permutations for overlapping rule
-        self.compatible_rule_index = self.build_compatibility_index(ruleset.permu_map)
-
-    def clone(self) -> EnumerationState:
-        """clone this state"""
-        state = EnumerationState()
-        state.fixed = set(self.fixed)
-        state.free = dict((rule, set(permu_set)) for rule, permu_set in self.free.items())
-        state.overlapping_rules = self.overlapping_rules
-        state.compatible_rule_index = self.compatible_rule_index
-        return state
-
-    def build_compatibility_index(self, rspm: Dict[Rule_, PermutationSet]) -> Dict[Tuple[Permutation, Rule_], PermutationSet]:
+        # mapping: (rule, permutation, overlapping rule) -> set of valid permutations for overlapping rule
+        masks = [index.mask(rule.cells_) for rule in rules]
+        self.compatible_rule_index = self.build_compatibility_index(self.free, masks)
+
+        self.cell_index = index
+        # mapping: rule id -> indexes of the cells it owns (see owned_cells())
+        self.owned = owned_cells(ruleset, rules)
+
+    def build_compatibility_index(
+        self, rspm: List[Set[int]], masks: List[int]
+    ) -> Dict[Tuple[int, int, int], Set[int]]:
         """build the constraint index"""
         index = {}
-        for rule, permu_set in rspm.items():
-            for permu in permu_set:
-                for rule_ov in self.overlapping_rules(rule):
-                    index[(permu, rule_ov)] = rspm[rule_ov].compatible(permu)
+        for rule, permu_set in enumerate(rspm):
+            for rule_ov in self.overlapping_rules(rule):
+                overlap = masks[rule] & masks[rule_ov]
+                buckets = CellIndex.project(rspm[rule_ov], overlap)
+                for permu in permu_set:
+                    # compatible permutations share a projection; note that
+                    # permutations with the same projection share one set
+                    index[(rule, permu, rule_ov)] = buckets[permu & overlap]
         return index
 
     def is_complete(self) -> bool:
         """return whether all rules have been 'fixed', i.e., the configuration
         is complete"""
-        return not self.free
-
-    def __iter__(self) -> Iterator[EnumerationState]:
-        """pick an 'open' rule at random and 'fix' each possible permutation
-        for that rule. in this manner, when done recursively, all valid
-        combinations are enumerated"""
-        rule = peek(self.free)
-        for permu in self.free[rule]:
-            try:
-                yield self.propogate(rule, permu)
-            except ValueError:
-                # conflict detected; dead end
-                pass
-
-    def propogate(self, rule: Rule_, permu: Permutation) -> EnumerationState:
-        """'fix' a permutation for a given rule"""
-        state = self.clone()
-        state._propogate(rule, permu)
-        return state
-
-    def _propogate(self, rule: Rule_, permu: Permutation) -> None:
+        return len(self.fixed) == len(self.free)
+
+    def next_rule(self) -> int:
+        """return the 'open' rule to branch on next"""
+        return self.branching(self)
+
+    def mark(self) -> Tuple[int, int]:
+        """return a restore point for undo()"""
+        return (len(self.trail), len(self.fixed))
+
+    def undo(self, mark: Tuple[int, int]) -> None:
+        """roll the state back to a restore point"""
+        trail_len, fixed_len = mark
+        trail, free = self.trail, self.free
+        for _ in range(len(trail) - trail_len):
+            rule, permus = trail.pop()
+            free[rule] = permus
+        del self.fixed[fixed_len:]
+        del self.fixed_rules[fixed_len:]
+
+    def propogate(self, rule: int, permu: int) -> None:
         """'fix' a rule permutation and constrain the available permutations
-        of all overlapping rules"""
-        self.fixed.add(permu)
-        del self.free[rule]
+        of all overlapping rules
+
+        raises ValueError on conflict, in which case the state is left
+        half-updated and must be undo()ne"""
+        free, trail = self.free, self.trail
+        self.fixed.append(permu)
+        self.fixed_rules.append(rule)
+        trail.append((rule, free[rule]))
+        free[rule] = None
 
         # constrain overlapping rules
         cascades = []
-        affected_rules = [r for r in self.overlapping_rules(rule) if r in self.free]
-        for related_rule in affected_rules:
-            # PermutationSet of the related rule, constrained _only by_ the rule/permutation just fixed
-            allowed_permus = self.compatible_rule_index[(permu, related_rule)]
+        for related_rule in self.overlapping_rules(rule):
+            permus = free[related_rule]
+            if permus is None:
+                continue
+            # permutations of the related rule, constrained _only by_ the rule/permutation just fixed
+            allowed_permus = self.compatible_rule_index[(rule, permu, related_rule)]
             # further constrain the related rule with this new set -- is now properly constrained by
             # all fixed rules
-            self.free[related_rule] &= set(allowed_permus)
+            linked_permus = permus & allowed_permus
+            if len(linked_permus) < len(permus):
+                trail.append((related_rule, permus))
+                free[related_rule] = linked_permus
 
-            linked_permus = self.free[related_rule]
             if len(linked_permus) == 0:
                 # conflict
                 raise ValueError()
@@ -931,22 +1348,439 @@ class EnumerationState(object):
 
         # cascade if any other rules are now fully constrained
         for related_rule, constrained_permu in cascades:
-            if related_rule in self.free:  # may have already been constrained by prior recurisve call
-                self._propogate(related_rule, constrained_permu)
-
-    def mine_config(self) -> Permutation:
-        """convert the set of fixed permutations into a single Permutation
-        encompassing the mine configuration for the entire ruleset"""
-        return reduce(lambda a, b: a.combine(b), self.fixed)
-
-    def enumerate(self) -> Iterator[Permutation]:
-        """recursively generate all possible mine configurations for the ruleset"""
+            if free[related_rule] is not None:  # may have already been constrained by prior recurisve call
+                self.propogate(related_rule, constrained_permu)
+
+    def mine_config(self) -> int:
+        """convert the set of fixed permutations into a single packed
+        permutation encompassing the mine configuration for the entire
+        ruleset"""
+        return reduce(operator.or_, self.fixed, 0)
+
+    def enumerate(self) -> Iterator[int]:
+        """recursively generate all possible mine configurations for the
+        ruleset, as packed permutations
+
+        pick an 'open' rule and 'fix' each possible permutation for that rule
+        in turn. in this manner, when done recursively, all valid combinations
+        are enumerated"""
         if self.is_complete():
             yield self.mine_config()
-        else:
-            for next_state in self:
-                for mineconfig in next_state.enumerate():
-                    yield mineconfig
+            return
+
+        rule = self.next_rule()
+        mark = self.mark()
+        for permu in self.free[rule]:
+            if self.token is not None:
+                self.token.check()
+            self.nodes += 1
+            try:
+                self.propogate(rule, permu)
+            except ValueError:
+                # conflict detected; dead end
+                self.dead_ends += 1
+            else:
+                yield from self.enumerate()
+            self.undo(mark)
+
+    def count(self) -> FrontTally:
+        """tally all possible mine configurations for the ruleset, without
+        generating them
+
+        with every cell owned by one rule (see owned_cells()), a
+        configuration's # of mines and multiplicity are a sum and product of
+        terms of its rule permutations. so rather than combining each
+        configuration and adding it cell by cell, the search sums up, for
+        every permutation fixed at a node, the configurations below that node
+        -- once per node instead of once per configuration -- and the per-cell
+        counts are expanded from those sums at the end
+
+        return a non-finalized tally"""
+        index = self.cell_index
+        # mapping: rule id -> (packed permutation -> (# mines, multiplicity) of the cells it owns)
+        local = []
+        for permus, owned in zip(self.free, self.owned):
+            terms = {}
+            for permu in permus:
+                mines, mult = 0, 1
+                for i in owned:
+                    n = (permu & index.masks[i]).bit_count()
+                    mines += n
+                    mult *= index.multiplicities[i][n]
+                terms[permu] = (mines, mult)
+            local.append(terms)
+        # mapping: rule id -> (packed permutation -> (# mines -> count of the configurations where it's fixed))
+        marginals = dict((rule, {}) for rule in range(len(self.free)))
+        free, fixed_rules, fixed, token = self.free, self.fixed_rules, self.fixed, self.token
+
+        def search(mines: int, weight: int) -> Dict[int, int]:
+            """count the configurations extending the current state, given the
+            # mines and multiplicity of the rules fixed so far
+
+            return -- mapping: # mines -> count, both excluding the fixed rules"""
+            total = collections.defaultdict(int)
+            rule = self.next_rule()
+            mark = self.mark()
+            for permu in free[rule]:
+                if token is not None:
+                    token.check()
+                self.nodes += 1
+                try:
+                    self.propogate(rule, permu)
+                except ValueError:
+                    # conflict detected; dead end
+                    self.dead_ends += 1
+                    self.undo(mark)
+                    continue
+
+                # the terms of the branch permutation and any it forced
+                node = [(fixed_rules[i], fixed[i]) for i in range(mark[1], len(fixed))]
+                node_mines, node_weight = 0, 1
+                for r, p in node:
+                    n, mult = local[r][p]
+                    node_mines += n
+                    node_weight *= mult
+
+                if self.is_complete():
+                    # a single configuration
+                    k, count = mines + node_mines, weight * node_weight
+                    for r, p in node:
+                        marginal = marginals[r].setdefault(p, collections.defaultdict(int))
+                        marginal[k] += count
+                    total[node_mines] += node_weight
+                else:
+                    below = search(mines + node_mines, weight * node_weight)
+                    for r, p in node:
+                        marginal = marginals[r].setdefault(p, collections.defaultdict(int))
+                        for k, count in below.items():
+                            marginal[mines + node_mines + k] += weight * node_weight * count
+                    for k, count in below.items():
+                        total[node_mines + k] += node_weight * count
+                self.undo(mark)
+            return total
+
+        totals = search(0, 1) if not self.is_complete() else {0: 1}
+        return tabulate_marginals(index, self.owned, totals, marginals)
+
+
+# fronts that could have at least this many configurations (see front_size())
+# are counted by tree decomposition rather than enumerated
+TREE_MIN_FRONT_SIZE = 10**7
+
+
+class TreeDecomposition(object):
+    """a counting engine for fronts too big to enumerate: dynamic programming
+    over a tree decomposition of the front's rule interference graph
+
+    each rule is a variable ranging over its (packed) permutations, and every
+    supercell is 'owned' by one rule containing it, which contributes the
+    cell's multiplicity and mines. a rule permutation is then a polynomial in
+    the # of mines (see MineCountPoly), and the front's tally is a sum of
+    products of those polynomials over all consistent assignments of
+    permutations -- which the tree lets us compute bag by bag, without ever
+    materializing a configuration. frontiers are nearly paths, so the bags
+    stay small
+
+    the tree comes from a greedy (min-fill) elimination order: eliminating a
+    rule yields a bag of it and its remaining neighbors, whose parent is the
+    bag of the first of those neighbors to be eliminated after it
+    """
+
+    def __init__(self, front: PermutedRuleset) -> None:
+        rules = list(front.permu_map)
+        rule_ids = dict((rule, i) for i, rule in enumerate(rules))
+        index = self.cell_index = front.cell_index
+
+        self.max_mines = index.full_mask.bit_length()
+        # mapping: rule id -> set of packed permutations
+        self.permus: List[Set[int]] = [set(front.packed_permus(rule)) for rule in rules]
+        neighbors = [set(rule_ids[r] for r in front.cell_rules_map.overlapping_rules(rule)) for rule in rules]
+        masks = [index.mask(rule.cells_) for rule in rules]
+        # mapping: (rule, overlapping rule) -> (packed permutations of rule, bucketed by projection onto the
+        # shared cells; see CellIndex.project(), shared cell mask)
+        self.buckets: Dict[Tuple[int, int], Tuple[Dict[int, Set[int]], int]] = {}
+        for a, a_neighbors in enumerate(neighbors):
+            for b in a_neighbors:
+                overlap = masks[a] & masks[b]
+                self.buckets[(a, b)] = (CellIndex.project(self.permus[a], overlap), overlap)
+
+        # mapping: rule id -> indexes of the cells it owns
+        self.owned: List[List[int]] = owned_cells(front, rules)
+
+        self.build(neighbors)
+
+    def build(self, neighbors: List[Set[int]]) -> None:
+        """pick an elimination order and derive the tree from it"""
+        graph = dict((rule, set(nbrs)) for rule, nbrs in enumerate(neighbors))
+        order = []
+        # mapping: rule -> the rules still uneliminated when it was eliminated (its separator)
+        separators = {}
+        while graph:
+
+            def fill(rule: int) -> int:
+                """# of edges eliminating 'rule' would add"""
+                nbrs = list(graph[rule])
+                return sum(1 for a, b in itertools.combinations(nbrs, 2) if b not in graph[a])
+
+            rule = min(graph, key=lambda r: (fill(r), len(graph[r]), r))
+            nbrs = graph.pop(rule)
+            for a in nbrs:
+                graph[a] |= nbrs - {a}
+                graph[a].discard(rule)
+            order.append(rule)
+            separators[rule] = nbrs
+
+        position = dict((rule, i) for i, rule in enumerate(order))
+        # elimination order, i.e., children before parents
+        self.order: List[int] = order
+        # mapping: rule -> separator rules, in elimination order
+        self.separator: Dict[int, Tuple[int, ...]] = dict(
+            (rule, tuple(sorted(sep, key=position.get))) for rule, sep in separators.items()
+        )
+        # mapping: rule -> rule whose bag is the parent of its bag (None for roots)
+        self.parent: Dict[int, Optional[int]] = dict(
+            (rule, sep[0] if sep else None) for rule, sep in self.separator.items()
+        )
+        self.children: Dict[int, List[int]] = dict((rule, []) for rule in order)
+        for rule in order:
+            if self.parent[rule] is not None:
+                self.children[self.parent[rule]].append(rule)
+
+    def bag(self, rule: int) -> Tuple[int, ...]:
+        """the rules in the bag of 'rule': itself, then its separator"""
+        return (rule,) + self.separator[rule]
+
+    def cost(self) -> int:
+        """upper bound on the # of bag assignments the dynamic program visits"""
+        return sum(product(len(self.permus[r]) for r in self.bag(rule)) for rule in self.order)
+
+    def assignments(self, bag: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+        """all mutually-compatible assignments of permutations to the rules of
+        'bag'"""
+        results = []
+        assigned = []
+
+        def extend(i: int) -> None:
+            if i == len(bag):
+                results.append(tuple(assigned))
+                return
+            rule = bag[i]
+            candidates = self.permus[rule]
+            for j in range(i):
+                if (rule, bag[j]) in self.buckets:
+                    buckets, overlap = self.buckets[(rule, bag[j])]
+                    candidates = candidates & buckets.get(assigned[j] & overlap, set())
+            for permu in candidates:
+                assigned.append(permu)
+                extend(i + 1)
+                assigned.pop()
+
+        extend(0)
+        return results
+
+    def local(self, rule: int, permu: int) -> MineCountPoly:
+        """the polynomial for 'rule' taking permutation 'permu': the
+        multiplicity and # of mines of the cells it owns"""
+        index = self.cell_index
+        mines, weight = 0, 1
+        for i in self.owned[rule]:
+            n = (permu & index.masks[i]).bit_count()
+            mines += n
+            weight *= index.multiplicities[i][n]
+        return (mines, [weight])
+
+    def count(self, token: Optional[CancellationToken] = None) -> FrontTally:
+        """run the upward and downward passes, and tabulate the result
+
+        token -- polled once per bag and pass"""
+        unit = (0, [1])
+        bags = dict((rule, self.bag(rule)) for rule in self.order)
+        assignments = dict((rule, self.assignments(bags[rule])) for rule in self.order)
+        local = dict(
+            (rule, dict((permu, self.local(rule, permu)) for permu in self.permus[rule])) for rule in self.order
+        )
+
+        def projector(rule: int, child: int) -> Callable[[Tuple[int, ...]], Tuple[int, ...]]:
+            """project an assignment of the bag of 'rule' onto the separator of 'child'"""
+            positions = [bags[rule].index(r) for r in self.separator[child]]
+            return lambda a: tuple(a[i] for i in positions)
+
+        # mapping: rule -> (separator assignment -> polynomial) sent up to the parent bag
+        up = {}
+        for rule in self.order:
+            if token is not None:
+                token.check()
+            projections = [(projector(rule, c), up[c]) for c in self.children[rule]]
+            message = {}
+            for a in assignments[rule]:
+                poly = local[rule][a[0]]
+                for project, child_message in projections:
+                    if project(a) not in child_message:
+                        # no consistent configuration of that subtree
+                        break
+                    poly = convolve(poly, child_message[project(a)], self.max_mines)
+                else:
+                    key = a[1:]
+                    message[key] = poly_add(message[key], poly) if key in message else poly
+                    continue
+            up[rule] = message
+
+        roots = [rule for rule in self.order if self.parent[rule] is None]
+        # total for each independent tree
+        totals = dict((root, up[root].get((), (0, []))) for root in roots)
+
+        # mapping: rule -> (separator assignment -> polynomial) sent down from the parent bag
+        down = {}
+        # mapping: rule -> (permutation -> polynomial over all configurations where it's fixed)
+        marginals = {}
+        for rule in reversed(self.order):
+            if token is not None:
+                token.check()
+            if self.parent[rule] is None:
+                poly = unit
+                for root in roots:
+                    if root != rule:
+                        poly = convolve(poly, totals[root], self.max_mines)
+                down[rule] = {(): poly}
+            children = self.children[rule]
+            projections = [(projector(rule, c), up[c]) for c in children]
+            outgoing = [{} for _ in children]
+            marginal = {}
+            for a in assignments[rule]:
+                if a[1:] not in down[rule]:
+                    continue
+                poly = convolve(local[rule][a[0]], down[rule][a[1:]], self.max_mines)
+                # products of the children's messages, excluding one child at a time
+                incoming = [child_message.get(project(a), ZERO_POLY) for project, child_message in projections]
+                prefix = [poly]
+                for message in incoming:
+                    prefix.append(convolve(prefix[-1], message, self.max_mines))
+                suffix = unit
+                for i in reversed(range(len(children))):
+                    key = projections[i][0](a)
+                    excluded = convolve(prefix[i], suffix, self.max_mines)
+                    outgoing[i][key] = poly_add(outgoing[i][key], excluded) if key in outgoing[i] else excluded
+                    suffix = convolve(suffix, incoming[i], self.max_mines)
+                full = prefix[-1]
+                marginal[a[0]] = poly_add(marginal[a[0]], full) if a[0] in marginal else full
+            for child, message in zip(children, outgoing):
+                down[child] = message
+            marginals[rule] = marginal
+
+        grand_total = unit
+        for total in totals.values():
+            grand_total = convolve(grand_total, total, self.max_mines)
+        return tabulate_marginals(
+            self.cell_index,
+            self.owned,
+            sparse_poly(grand_total),
+            dict(
+                (rule, dict((permu, sparse_poly(poly)) for permu, poly in marginal.items()))
+                for rule, marginal in marginals.items()
+            ),
+        )
+
+
+# fronts whose exact tally would cost at least this much (see exact_cost())
+# are sampled rather than counted in approximate mode
+APPROX_MIN_COST = 10**6
+# of batches each sampled front's samples are split into; confidence
+# intervals come from the spread of the solutions of the individual batches
+APPROX_BATCHES = 10
+# two-sided 95% quantile of Student's t distribution with APPROX_BATCHES - 1
+# degrees of freedom
+APPROX_T_QUANTILE = 2.262
+# default time budget for an approximate solve, in milliseconds
+APPROX_BUDGET_MS = 500
+
+
+def exact_cost(front: PermutedRuleset) -> int:
+    """estimate the work of tallying a front exactly, in configurations
+    enumerated or bag assignments visited (see FrontTally.tally())"""
+    size = front_size(front)
+    if size < TREE_MIN_FRONT_SIZE:
+        return size
+    return min(size, TreeDecomposition(front).cost())
+
+
+class FrontSampler(object):
+    """an anytime estimator of a front's tally, for fronts too big to count
+    exactly
+
+    each sample is a random descent of the enumeration search tree (see
+    EnumerationState) -- picking uniformly among the open permutations of the
+    rule to branch on -- that weights the configuration it reaches by the
+    product of the branching factors along the way (Knuth's estimator; a
+    sequential importance sampler). this makes the weighted sums unbiased
+    estimates of the exact tally's totals and per-cell counts; descents that
+    hit a conflict count as samples of weight 0
+
+    samples are dealt round-robin into APPROX_BATCHES batches, each an
+    independent estimate
+    """
+
+    def __init__(
+        self, front: PermutedRuleset, rng: random.Random, token: Optional[CancellationToken] = None
+    ) -> None:
+        """token -- polled before every sample"""
+        self.state = EnumerationState(front)
+        self.token = token
+        self.cells_ = front.cells_
+        self.cell_index = front.cell_index
+        self.rng = rng
+        # per batch: raw (non-finalized) sum of the weighted samples
+        self.batches: List[FrontTally] = [FrontTally() for _ in range(APPROX_BATCHES)]
+        # per batch: # of samples drawn, and # that reached a configuration
+        self.draws: List[int] = [0] * APPROX_BATCHES
+        self.hits: List[int] = [0] * APPROX_BATCHES
+        self.samples: int = 0
+
+    def sample(self) -> None:
+        """draw a sample into the next batch"""
+        if self.token is not None:
+            self.token.check()
+        state = self.state
+        mark = state.mark()
+        weight = 1
+        config = None
+        try:
+            while not state.is_complete():
+                rule = state.next_rule()
+                permus = state.free[rule]
+                weight *= len(permus)
+                state.nodes += 1
+                state.propogate(rule, self.rng.choice(tuple(permus)))
+            config = state.mine_config()
+        except ValueError:
+            # conflict detected; dead end
+            state.dead_ends += 1
+        state.undo(mark)
+
+        batch = self.samples % APPROX_BATCHES
+        self.samples += 1
+        self.draws[batch] += 1
+        if config is not None:
+            self.batches[batch].subtallies[config.bit_count()].add_packed(config, self.cell_index, weight)
+            self.hits[batch] += 1
+
+    def is_ready(self) -> bool:
+        """whether every batch has an estimate"""
+        return all(self.hits)
+
+    def estimate(self, batch: Optional[int] = None) -> FrontTally:
+        """return the (finalized) tally estimated from one batch, or from
+        all of them"""
+        batches = range(APPROX_BATCHES) if batch is None else [batch]
+        draws = float(sum(self.draws[b] for b in batches))
+        tally = FrontTally()
+        for b in batches:
+            for num_mines, sampled in self.batches[b]:
+                subtally = tally.subtallies[num_mines]
+                subtally.total += sampled.total / draws
+                for cell_, n in sampled.tally.items():
+                    subtally.tally[cell_] += n / draws
+        tally.finalize()
+        return tally
 
 
 class FrontSubtally(object):
@@ -972,10 +1806,18 @@ class FrontSubtally(object):
         for cell_, n in config.mapping.items():
             self.tally[cell_] += n * mult
 
+    def add_packed(self, config: int, index: CellIndex, weight: float = 1) -> None:
+        """add a bit-packed configuration (see CellIndex) to the tally,
+        counted 'weight' times"""
+        mult = index.multiplicity(config) * weight
+        self.total += mult
+        for cell_, n in index.counts(config):
+            self.tally[cell_] += n * mult
+
     def finalize(self) -> None:
         """after all configurations have been summed, compute relative
         prevalence from totals"""
-        self.tally = dict((cell_, n / float(self.total)) for cell_, n in self.tally.items())
+        self.tally = dict((cell_, n / self.total) for cell_, n in self.tally.items())
         self.finalized = True
 
     def collapse(
@@ -1001,7 +1843,7 @@ class FrontSubtally(object):
         return str((self.total, dict(self.tally)))
 
 
-def enumerate_front(front: PermutedRuleset) -> FrontTally:
+def enumerate_front(front: PermutedRuleset, token: Optional[CancellationToken] = None) -> FrontTally:
     """enumerate and tabulate all mine configurations for the given front
 
     return a tally where: sub-totals are split out by total # of mines in
@@ -1009,10 +1851,169 @@ def enumerate_front(front: PermutedRuleset) -> FrontTally:
     configurations, and expected # of mines in each cell
     """
     tally = FrontTally()
-    tally.tally(front)
+    tally.tally(front, token)
     return tally
 
 
+def canonical_front(front: PermutedRuleset) -> Tuple[Tuple, List[frozenset]]:
+    """compute a relabeling of the front's supercells that depends only on
+    the structure of the front (rule topology, supercell sizes, # mines, and
+    surviving permutations), not on the cell names
+
+    returns (key, cells): 'cells' lists the supercells in label order, and
+    'key' is a complete, hashable description of the front in terms of those
+    labels. two fronts with equal keys are therefore isomorphic via their
+    label orders.
+
+    labels come from colour refinement, individualizing one cell whenever
+    refinement stalls. this is not a perfect canonical form (symmetric fronts
+    that refinement can't tell apart may get different keys) but equal keys
+    are always correct
+    """
+
+    def rank(colors):
+        ranks = dict((color, i) for i, color in enumerate(sorted(set(colors.values()))))
+        return dict((o, ranks[color]) for o, color in colors.items())
+
+    cell_rules = front.cell_rules_map.map
+    cell_color = rank(dict((cell_, len(cell_)) for cell_ in front.cells_))
+    rule_color = rank(dict((rule, (rule.num_mines, len(front.permu_map[rule].permus))) for rule in front.rules))
+
+    while True:
+        num_classes = -1
+        while num_classes < len(set(cell_color.values())) + len(set(rule_color.values())):
+            num_classes = len(set(cell_color.values())) + len(set(rule_color.values()))
+            cell_color = rank(
+                dict(
+                    (cell_, (color, tuple(sorted(rule_color[r] for r in cell_rules[cell_]))))
+                    for cell_, color in cell_color.items()
+                )
+            )
+            rule_color = rank(
+                dict(
+                    (rule, (color, tuple(sorted(cell_color[c] for c in rule.cells_))))
+                    for rule, color in rule_color.items()
+                )
+            )
+
+        class_sizes = collections.Counter(cell_color.values())
+        ties = [color for color, n in class_sizes.items() if n > 1]
+        if not ties:
+            break
+        # break the first tie arbitrarily and refine again
+        tied = min(ties)
+        chosen = peek(cell_ for cell_, color in cell_color.items() if color == tied)
+        cell_color = rank(dict((cell_, (color, cell_ is chosen)) for cell_, color in cell_color.items()))
+
+    cells = sorted(cell_color, key=lambda cell_: cell_color[cell_])
+
+    def rule_key(rule):
+        rule_cells = sorted(rule.cells_, key=lambda cell_: cell_color[cell_])
+        permus = sorted(tuple(permu.mapping[cell_] for cell_ in rule_cells) for permu in front.permu_map[rule])
+        return (tuple(cell_color[cell_] for cell_ in rule_cells), rule.num_mines, tuple(permus))
+
+    key = (tuple(len(cell_) for cell_ in cells), tuple(sorted(rule_key(rule) for rule in front.rules)))
+    return key, cells
+
+
+def front_from_key(key: Tuple) -> Tuple[PermutedRuleset, List[frozenset]]:
+    """rebuild a front from its canonical key (see canonical_front()), with
+    placeholder supercells; returns the front and its supercells in label
+    order"""
+    sizes, rule_keys = key
+    cells = [set_((label, i) for i in range(size)) for label, size in enumerate(sizes)]
+    permu_map = {}
+    for labels, num_mines, permus in rule_keys:
+        rule_cells = [cells[label] for label in labels]
+        rule = Rule_(num_mines, set_(rule_cells))
+        permu_map[rule] = PermutationSet(
+            rule.cells_, num_mines, set(Permutation(zip(rule_cells, counts)) for counts in permus)
+        )
+    return PermutedRuleset(set(permu_map), permu_map), cells
+
+
+def pack_tally(tally: FrontTally, cells: List[frozenset]) -> Tuple:
+    """flatten a finalized tally into label space: a tuple of
+    (# mines, total, (expected mines per label, ...))"""
+    return tuple(
+        (num_mines, subtally.total, tuple(subtally.tally[cell_] for cell_ in cells)) for num_mines, subtally in tally
+    )
+
+
+def unpack_tally(packed: Tuple, cells: List[frozenset]) -> FrontTally:
+    """inverse of pack_tally(), mapping labels onto 'cells'"""
+    return FrontTally(
+        dict((num_mines, FrontSubtally.mk(total, dict(zip(cells, expected)))) for num_mines, total, expected in packed)
+    )
+
+
+def enumerate_front_key(key: Tuple) -> Tuple:
+    """enumerate a front given as a canonical key; returns the packed tally.
+    key and result are plain tuples, suitable for sending to/from worker
+    processes"""
+    front, cells = front_from_key(key)
+    return pack_tally(enumerate_front(front), cells)
+
+
+def front_size(front: PermutedRuleset) -> int:
+    """upper bound on the # of configurations enumerating 'front' could visit"""
+    return product(len(permu_set.permus) for permu_set in front.permu_map.values())
+
+
+class FrontTallyCache(object):
+    """bounded LRU cache of front tallies, shared across fronts with the same
+    structure (see canonical_front()), whether in the same board, later moves,
+    or other games
+
+    entries are stored in label space (see pack_tally()) and remapped onto the
+    requesting front's supercells on a hit
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        # mapping: canonical key -> packed tally
+        self.entries: collections.OrderedDict = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Tuple, cells: List[frozenset]) -> Optional[FrontTally]:
+        """return the cached tally for canonical 'key', mapped onto 'cells',
+        or None"""
+        packed = self.entries.get(key)
+        if packed is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return unpack_tally(packed, cells)
+
+    def put(self, key: Tuple, packed: Tuple) -> None:
+        self.entries[key] = packed
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def tally(self, front: PermutedRuleset, token: Optional[CancellationToken] = None) -> FrontTally:
+        """return the finalized tally for 'front', enumerating it only if no
+        equivalent front is cached"""
+        key, cells = canonical_front(front)
+        tally = self.get(key, cells)
+        if tally is None:
+            tally = enumerate_front(front, token)
+            self.put(key, pack_tally(tally, cells))
+        return tally
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
 def cell_probabilities(tallies: Set[FrontTally], mine_prevalence: MineCount, all_cells: List[frozenset]) -> chain:
     """generate the final expected values for all cells in all fronts
 
@@ -1043,6 +2044,11 @@ def weight_subtallies(tallies: Set[FrontTally], mine_prevalence: MineCount, all_
     # tallies with only one sub-tally don't need weighting
     dyn_tallies = set(tally for tally in tallies if not tally.is_static())
 
+    # bring exact counts into float range before any of them meet a float;
+    # combine_fronts() does so for the fronts it weights
+    for tally in tallies - dyn_tallies if discrete_mode else tallies:
+        tally.rescale()
+
     if discrete_mode:
         num_static_mines = sum(tally.max_mines() for tally in (tallies - dyn_tallies))
         at_large_mines = mine_prevalence.total_mines - num_static_mines
@@ -1093,170 +2099,65 @@ def check_count_consistency(tallies: Set[FrontTally], mine_prevalence: MineCount
     return num_uncharted_cells
 
 
-class FrontPerMineTotals(object):
-    """object that tracks, for a constituent front, how many configurations for each # of mines
-    in the front"""
-
-    def __init__(self, totals: Union[Dict[int, float], Dict[int, int]]) -> None:
-        """totals: mapping of # mines -> # configurations"""
-        self.totals = totals
-
-    @staticmethod
-    def singleton(num_mines: int, total: float) -> FrontPerMineTotals:
-        return FrontPerMineTotals({num_mines: total})
-
-    @property
-    def total_count(self) -> float:
-        """returns total # of configurations across all possible # of mines"""
-        return sum(self.totals.values())
-
-    def multiply(self, n: float) -> FrontPerMineTotals:
-        """multiply all the configuration counts by a fixed factor"""
-        return FrontPerMineTotals(dict((num_mines, n * count) for num_mines, count in self))
-
-    @staticmethod
-    def sum(front_totals: Tuple[FrontPerMineTotals, ...]) -> FrontPerMineTotals:
-        """compute an aggregate sum of several mappings"""
-        return FrontPerMineTotals(map_reduce(front_totals, lambda ft: ft, sum))
-
-    def __iter__(self) -> Iterator[tuple[int, float]]:
-        return iter(self.totals.items())
-
-    def __repr__(self):
-        return str(self.totals)
-
-
-class AllFrontsPerMineTotals(object):
-    """object that tracks, for a given # of mines in the CombinedFront, the FrontPerMineTotals objects
-    corresponding to each constituent front"""
-
-    def __init__(self, front_totals: List[FrontPerMineTotals]) -> None:
-        """front_totals: a list of FrontPerMineTotals objects"""
-        self.front_totals = front_totals
-
-    @property
-    def total_count(self) -> float:
-        """total number of configurations for the given total # of mines in the combined front"""
-        if self.front_totals:
-            # the count should match for each constituent front
-            return self.front_totals[0].total_count
-        else:
-            # null case
-            return 1
-
-    @staticmethod
-    def null() -> AllFrontsPerMineTotals:
-        return AllFrontsPerMineTotals([])
-
-    @staticmethod
-    def singleton(num_mines: int, total: float) -> AllFrontsPerMineTotals:
-        return AllFrontsPerMineTotals([FrontPerMineTotals.singleton(num_mines, total)])
-
-    def join_with(self, new: Self) -> AllFrontsPerMineTotals:
-        """merge two AllFrontsPerMineTotals objects, joining into a single list and performing
-        necessary cross-multiplication"""
-        return AllFrontsPerMineTotals(
-            [f.multiply(new.total_count) for f in self.front_totals] + [f.multiply(self.total_count) for f in new.front_totals]
-        )
-
-    @staticmethod
-    def sum(frontsets: List[AllFrontsPerMineTotals]) -> AllFrontsPerMineTotals:
-        """sum a list of AllFrontsPerMineTotals objects on a per-constituent front basis"""
-        return AllFrontsPerMineTotals(list(map(FrontPerMineTotals.sum, list(zip(*frontsets)))))
-
-    def __iter__(self) -> Iterator[FrontPerMineTotals]:
-        return iter(self.front_totals)
-
-    def __repr__(self):
-        return str((self.total_count, self.front_totals))
+def relative_likelihood(num_free_mines: int, num_uncharted_cells: int, max_other_mines: int) -> float:
+    return discrete_relative_likelihood(num_uncharted_cells, num_free_mines, max_other_mines)
 
 
-class CombinedFront(object):
-    """a representation of a combinatorial fusing of multiple fronts/tallies. essentially, track:
-    for total # of mines in the combined front -> for each constituent front -> count of total # of
-    configurations for each # of mines in the constituent front"""
+# a polynomial in the # of mines, as (lowest # of mines, [coefficient for
+# lowest, lowest + 1, ...]); the coefficients are configuration counts /
+# relative likelihoods
+MineCountPoly = Tuple[int, List[float]]
+# the polynomial with no terms, i.e., no possible configurations
+ZERO_POLY: MineCountPoly = (0, [])
 
-    def __init__(self, total_mines_to_front_totals: Dict[int, AllFrontsPerMineTotals]) -> None:
-        """total_mines_to_front_totals: a mapping of total # of mines in the combined front to
-        a AllFrontsPerMineTotals object"""
-        self.totals = total_mines_to_front_totals
 
-    @property
-    def min_max_mines(self) -> Tuple[int, ...]:
-        """return (min, max) # of mines in the front"""
-        return tuple(f(list(self.totals.keys())) for f in (min, max))
+def rescale_poly(poly: MineCountPoly) -> MineCountPoly:
+    """scale a polynomial to a largest coefficient of 1 (if it has a nonzero one)"""
+    lo, coeffs = poly
+    top = max(coeffs, default=0)
+    return (lo, [c / top for c in coeffs]) if top else poly
 
-    @staticmethod
-    def null() -> CombinedFront:
-        """create an 'empty' combined front"""
-        return CombinedFront({0: AllFrontsPerMineTotals.null()})
 
-    @staticmethod
-    def from_counts_per_num_mines(mines_with_count: Iterator) -> CombinedFront:
-        """build a starter combined front using known counts for each # of mines"""
-        return CombinedFront(
-            dict((num_mines, AllFrontsPerMineTotals.singleton(num_mines, total)) for num_mines, total in mines_with_count)
-        )
+def mine_count_poly(weights: Dict[int, float]) -> MineCountPoly:
+    """build a polynomial from a sparse mapping: # mines -> weight"""
+    lo = min(weights)
+    coeffs = [0.0] * (max(weights) - lo + 1)
+    for num_mines, weight in weights.items():
+        coeffs[num_mines - lo] = weight
+    return (lo, coeffs)
 
-    @staticmethod
-    def from_tally(tally: FrontTally) -> CombinedFront:
-        """build a starter combined front from a front tally"""
-        return CombinedFront.from_counts_per_num_mines((num_mines, subtally.total) for num_mines, subtally in tally)
 
-    @staticmethod
-    def for_other(
-        min_mines: Union[int, int],
-        max_mines: Union[int, int],
-        num_uncharted_cells: int,
-        max_other_mines: Union[int, int],
-    ) -> CombinedFront:
-        """build a starter combined front to represent the 'uncharted cells' region"""
-        return CombinedFront.from_counts_per_num_mines(
-            (n, relative_likelihood(n, num_uncharted_cells, max_other_mines)) for n in range(min_mines, max_mines + 1)
-        )
+def sparse_poly(poly: MineCountPoly) -> Dict[int, float]:
+    """the inverse of mine_count_poly(): mapping: # mines -> weight, for the
+    non-zero terms"""
+    lo, coeffs = poly
+    return dict((num_mines, weight) for num_mines, weight in enumerate(coeffs, lo) if weight)
 
-    # @staticmethod
-    def join_with(
-        self,
-        new: Self,
-        min_remaining_mines: int,
-        max_remaining_mines: int,
-        at_large_mines: Union[int, int],
-    ) -> CombinedFront:
-        """combine two combined fronts. min/max remaining mines represent the total remaining mines available
-        in all fronts yet to be combined (excluding 'new'). this helps avoid computing combinations whose # mines
-        can never add up to the requisite # of board mines. this is also how we converge to a single total # of
-        mines upon combining all fronts"""
-
-        def cross_entry(
-            xxx_todo_changeme: Tuple[Tuple[int, AllFrontsPerMineTotals], Tuple[int, AllFrontsPerMineTotals]]
-        ) -> Tuple[int, AllFrontsPerMineTotals] | None:
-            ((a_num_mines, a_fronts), (b_num_mines, b_fronts)) = xxx_todo_changeme
-            combined_mines = a_num_mines + b_num_mines
-            min_mines_at_end = combined_mines + min_remaining_mines
-            max_mines_at_end = combined_mines + max_remaining_mines
-            if min_mines_at_end > at_large_mines or max_mines_at_end < at_large_mines:
-                return None
-            return (combined_mines, a_fronts.join_with(b_fronts))
-
-        cross_entries = [_f for _f in map(cross_entry, itertools.product(self, new)) if _f]
-        new_totals = map_reduce(cross_entries, lambda kv: [kv], AllFrontsPerMineTotals.sum)
-        return CombinedFront(new_totals)
-
-    def collapse(self) -> List[dict[int, float] | dict[int, int]]:
-        """once all fronts combined, unwrap objects and return the underlying counts corresponding to each front"""
-        assert len(self.totals) == 1
-        return [e.totals for e in self.totals.popitem()[1].front_totals]
-
-    def __iter__(self) -> Iterator[tuple[int, AllFrontsPerMineTotals]]:
-        return iter(self.totals.items())
 
-    def __repr__(self):
-        return str(self.totals)
+def convolve(a: MineCountPoly, b: MineCountPoly, max_mines: int) -> MineCountPoly:
+    """multiply two polynomials, i.e., compute the distribution of the total
+    # of mines across two independent regions. terms for more than
+    'max_mines' mines are dropped"""
+    (a_lo, a_coeffs), (b_lo, b_coeffs) = a, b
+    lo = a_lo + b_lo
+    n = min(len(a_coeffs) + len(b_coeffs) - 1, max_mines - lo + 1)
+    coeffs = [0] * max(n, 0)
+    for i, x in enumerate(a_coeffs[:n]):
+        if x:
+            for j, y in enumerate(b_coeffs[: n - i]):
+                coeffs[i + j] += x * y
+    return (lo, coeffs)
 
 
-def relative_likelihood(num_free_mines: int, num_uncharted_cells: int, max_other_mines: int) -> float:
-    return discrete_relative_likelihood(num_uncharted_cells, num_free_mines, max_other_mines)
+def poly_add(a: MineCountPoly, b: MineCountPoly) -> MineCountPoly:
+    """add two polynomials"""
+    (a_lo, a_coeffs), (b_lo, b_coeffs) = a, b
+    lo = min(a_lo, b_lo)
+    coeffs = [0] * (max(a_lo + len(a_coeffs), b_lo + len(b_coeffs)) - lo)
+    for offset, poly_coeffs in ((a_lo - lo, a_coeffs), (b_lo - lo, b_coeffs)):
+        for i, x in enumerate(poly_coeffs, offset):
+            coeffs[i] += x
+    return (lo, coeffs)
 
 
 def combine_fronts(
@@ -1269,6 +2170,12 @@ def combine_fronts(
     compute the likelihood of each front containing each possible # of mines.
     in the process, compute the mine count likelihood for the 'other' cells,
     not a part of any front, and return a meta-front encapsulating them.
+
+    each front (and the 'other' cells) is a polynomial in its # of mines; the
+    weight of a front having m mines is its own count for m times the
+    coefficient for (at_large_mines - m) in the product of all the other
+    fronts' polynomials. those products come from prefix and suffix products,
+    so every front is weighted in a single pass
     """
 
     min_tallied_mines, max_tallied_mines = possible_mine_limits(set(tallies))
@@ -1276,21 +2183,47 @@ def combine_fronts(
     # technically, min_tallied_mines known to be <= at_large_mines due to check_count_consistency()
     max_other_mines = min(max(at_large_mines - min_tallied_mines, 0), num_uncharted_cells)
 
-    tallies = set(tallies)  # we need guaranteed iteration order
-    all_fronts: list[CombinedFront] = list(map(CombinedFront.from_tally, tallies)) + [
-        CombinedFront.for_other(min_other_mines, max_other_mines, num_uncharted_cells, max_other_mines)
-    ]
-    min_remaining_mines, max_remaining_mines = list(map(sum, list(zip(*(f.min_max_mines for f in all_fronts)))))
-    combined: CombinedFront = CombinedFront.null()
-    for f in all_fronts:
-        # note that it's only safe to use min/max mines in this way before the front has been combined/modified
-        front_min, front_max = f.min_max_mines
-        min_remaining_mines -= front_min
-        max_remaining_mines -= front_max
-        combined = combined.join_with(f, min_remaining_mines, max_remaining_mines, at_large_mines)
-    front_totals = combined.collapse()
-    uncharted_total = front_totals[-1]
-    front_totals = front_totals[:-1]
+    tallies = list(tallies)
+    for tally in tallies:
+        # the # of mines the other fronts and the 'other' cells leave room for
+        tally.rescale(
+            at_large_mines - (max_tallied_mines - tally.max_mines()) - num_uncharted_cells,
+            at_large_mines - (min_tallied_mines - tally.min_mines()),
+        )
+    polys = [mine_count_poly(dict((num_mines, subtally.total) for num_mines, subtally in tally)) for tally in tallies]
+    polys.append(
+        (
+            min_other_mines,
+            [
+                relative_likelihood(n, num_uncharted_cells, max_other_mines)
+                for n in range(min_other_mines, max_other_mines + 1)
+            ],
+        )
+    )
+
+    # prefixes[i]: product of polys[:i]; suffixes[i]: product of polys[i + 1:].
+    # each is kept rescaled to a largest coefficient of 1: that scales all of
+    # a front's weights alike, which normalizing undoes, and keeps long
+    # products from under- or overflowing
+    prefixes = [(0, [1.0])]
+    for poly in polys[:-1]:
+        prefixes.append(rescale_poly(convolve(prefixes[-1], poly, at_large_mines)))
+    suffixes = [(0, [1.0])]
+    for poly in reversed(polys[1:]):
+        suffixes.append(rescale_poly(convolve(poly, suffixes[-1], at_large_mines)))
+    suffixes.reverse()
+
+    front_totals = []
+    for (lo, coeffs), (pre_lo, pre), (suf_lo, suf) in zip(polys, prefixes, suffixes):
+        weights = {}
+        for num_mines, count in enumerate(coeffs, lo):
+            # coefficient for (at_large_mines - num_mines) in the product of all other fronts
+            target = at_large_mines - num_mines - pre_lo - suf_lo
+            others = sum(pre[i] * suf[target - i] for i in range(max(0, target - len(suf) + 1), min(len(pre), target + 1)))
+            if count and others:
+                weights[num_mines] = count * others
+        front_totals.append(weights)
+    uncharted_total = front_totals.pop()
 
     # upate tallies with adjusted weights
     for tally, front_total in zip(tallies, front_totals):
@@ -1324,11 +2257,14 @@ def nondiscrete_relative_likelihood(p, k, k0):
 
 
 def discrete_relative_likelihood(n: int, k: int, k0: int) -> float:
-    """return 'n choose k' / 'n choose k0'"""
+    """return 'n choose k' / 'n choose k0'
+
+    computed in log space, so it neither overflows nor loses precision for
+    large # of uncharted cells"""
     if any(x < 0 or x > n for x in (k, k0)):
         raise ValueError("k, k0 must be [0, n]")
 
-    return float(fact_div(k0, k) * fact_div(n - k0, n - k))
+    return math.exp(combinatorics.log_choose(n, k) - combinatorics.log_choose(n, k0))
 
 
 class FixedProbTally(ImmutableMixin):
@@ -1353,20 +2289,202 @@ def expand_cells(cell_probs: chain, other_tag: Optional[Any]) -> Iterator[tuple[
             yield (cell if cell is not None else other_tag, p / len(cell_))
 
 
-def permute_and_interfere(rules: Set[Rule_]) -> PermutedRuleset:
+def expand_cells_into(cell_probs: chain, out: List[float]) -> List[float]:
+    """like expand_cells(), but write the per-cell probabilities straight into
+    'out', a flat buffer indexed by integer cell id. every entry not covered
+    by a rule is set to the probability of the 'other' cells (0. if there are
+    none)"""
+    cell_probs = list(cell_probs)
+    other_prob = 0.0
+    for cell_, p in cell_probs:
+        if isinstance(cell_, UnchartedCell):
+            other_prob = p / len(cell_) if len(cell_) else 0.0
+    out[:] = [other_prob] * len(out)
+
+    for cell_, p in cell_probs:
+        if not isinstance(cell_, UnchartedCell):
+            p /= len(cell_)
+            for cell in cell_:
+                out[cell] = p
+    return out
+
+
+class CellProbabilities(object):
+    """a solution that answers per-cell queries on demand: it keeps the
+    expected # of mines of each supercell (and of the 'other' cells), rather
+    than expanding them into a probability for every cell up front as
+    expand_cells() does. batch queries scan the supercells; single-cell
+    queries build a per-cell index on first use
+
+    cells not mentioned in any rule are 'other' cells"""
+
+    def __init__(self, cell_probs: Iterable[Tuple[Any, float]], other_tag: Optional[Any] = None) -> None:
+        """
+        cell_probs -- (supercell, expected # of mines), as from cell_probabilities()
+        other_tag -- see solve()
+        """
+        self.cell_probs: List[Tuple[Any, float]] = list(cell_probs)
+        self.other_tag = other_tag
+        # mapping: cell in a rule -> probability; built by the first prob()
+        self.index: Optional[Dict[Any, float]] = None
+
+    def other_prob(self) -> Optional[float]:
+        """return the probability for the 'other' cells; None if there are none"""
+        for cell_, expected_mines in self.cell_probs:
+            if isinstance(cell_, UnchartedCell):
+                return expected_mines / len(cell_) if len(cell_) else None
+        return None
+
+    def prob(self, cell: Any) -> float:
+        """return the probability that 'cell' is a mine; see probs()"""
+        if self.index is None:
+            self.index = dict(
+                (cell, expected_mines / len(cell_))
+                for cell_, expected_mines in self.cell_probs
+                if not isinstance(cell_, UnchartedCell)
+                for cell in cell_
+            )
+        return self.probs([cell])[0]
+
+    def probs(self, cells: Iterable[Any]) -> List[float]:
+        """return the probabilities for a batch of cells, in order, in a
+        single scan of the supercells
+
+        raises KeyError for a cell not in any rule if there are no 'other'
+        cells"""
+        cells = list(cells)
+        wanted = set(cells)
+        found = {}
+        if self.index is not None:
+            found = dict((cell, self.index[cell]) for cell in wanted if cell in self.index)
+            wanted.difference_update(found)
+        for cell_, expected_mines in self.cell_probs if wanted and self.index is None else ():
+            if not wanted.isdisjoint(cell_):
+                p = expected_mines / len(cell_)
+                for cell in wanted.intersection(cell_):
+                    found[cell] = p
+                wanted.difference_update(cell_)
+                if not wanted:
+                    break
+        if wanted:
+            other_prob = self.other_prob()
+            if other_prob is None:
+                raise KeyError(peek(wanted))
+            found.update((cell, other_prob) for cell in wanted)
+        return [found[cell] for cell in cells]
+
+    def argmin(self, cells: Optional[Iterable[Any]] = None) -> Tuple[Any, float]:
+        """return (cell, probability) for the cell least likely to be a mine
+
+        cells -- candidates to choose from (e.g., the covered cells); default:
+          every cell in a rule. the 'other' cells aren't named here, so if one
+          of them would be the pick -- or there are no cells in any rule --
+          raise ValueError rather than guess; pass the candidates instead"""
+        if cells is not None:
+            cells = list(cells)
+            return min(zip(cells, self.probs(cells)), key=operator.itemgetter(1))
+
+        cell_, p = min(
+            ((cell_, expected_mines / len(cell_)) for cell_, expected_mines in self.cell_probs if len(cell_)),
+            key=operator.itemgetter(1),
+            default=(None, None),
+        )
+        if cell_ is None or isinstance(cell_, UnchartedCell):
+            raise ValueError("the least likely mine is among the 'other' cells; pass the candidate cells")
+        return (peek(cell_), p)
+
+    def to_dict(self) -> Dict[Any, float]:
+        """expand into the dict solve() returns by default"""
+        return dict(expand_cells(self.cell_probs, self.other_tag))
+
+
+# fronts with fewer possible configurations than this (see front_size()) are
+# not worth the round trip to a worker process
+PARALLEL_MIN_FRONT_SIZE = 4096
+
+
+def tally_fronts(
+    fronts: Iterable[PermutedRuleset],
+    tally_cache: Optional[FrontTallyCache] = None,
+    executor: Optional[concurrent.futures.Executor] = None,
+    token: Optional[CancellationToken] = None,
+) -> List[FrontTally]:
+    """enumerate_front() each front, going through 'tally_cache' if given.
+    if 'executor' is given, large fronts are enumerated on it concurrently
+    while small fronts are handled inline. tallies are returned in the same
+    order as 'fronts'
+
+    on cancellation by 'token', fronts still pending on the executor are
+    cancelled (those already running finish in the background)"""
+    tallies: List[Optional[FrontTally]] = []
+    pending = []
+    for front in fronts:
+        if executor is not None and front_size(front) >= PARALLEL_MIN_FRONT_SIZE:
+            key, cells = canonical_front(front)
+            tally = tally_cache.get(key, cells) if tally_cache is not None else None
+            if tally is None:
+                pending.append((len(tallies), key, cells, executor.submit(enumerate_front_key, key)))
+        elif tally_cache is not None:
+            tally = tally_cache.tally(front, token)
+        else:
+            tally = enumerate_front(front, token)
+        tallies.append(tally)
+
+    for n, (i, key, cells, future) in enumerate(pending):
+        # wait in short slices, so cancellation is noticed while waiting
+        while token is not None and not future.done():
+            if token.cancelled():
+                for _, _, _, f in pending[n:]:
+                    f.cancel()
+                raise Cancelled()
+            concurrent.futures.wait([future], timeout=0.05)
+        packed = future.result()
+        if tally_cache is not None:
+            tally_cache.put(key, packed)
+        tallies[i] = unpack_tally(packed, cells)
+    return tallies
+
+
+def permute_and_interfere(rules: Set[Rule_], token: Optional[CancellationToken] = None) -> PermutedRuleset:
     """process the set of rules and analyze the relationships and constraints
     among them"""
     ruleset = PermutedRuleset(rules)
-    ruleset.cross_eliminate()
+    ruleset.cross_eliminate(token)
     ruleset.rereduce()
     return ruleset
 
 
-def reduce_rules(rules: List[Rule_]) -> Set[Rule_]:
-    """reduce ruleset using logical deduction"""
-    rr = RuleReducer()
+def reduce_rules(
+    rules: List[Rule_], rr: Optional[RuleReducer] = None, token: Optional[CancellationToken] = None
+) -> Set[Rule_]:
+    """reduce ruleset using logical deduction
+
+    rr -- reducer to use, if the caller wants to keep its state
+    """
+    if rr is None:
+        rr = RuleReducer()
     rr.add_rules(rules)
-    return rr.reduce_all()
+    return rr.reduce_all(token)
+
+
+def reduce_and_split(
+    rules: List[Rule_], rr: Optional[RuleReducer] = None, token: Optional[CancellationToken] = None
+) -> Tuple[Set[Rule_], Set[PermutedRuleset]]:
+    """run the logical deduction and permutation phases on a condensed
+    ruleset. returns the trivial rules (those whose cells are fully
+    determined) and the remaining, combinatorially-independent fronts"""
+    ruless = set(reduce_rules(rules, rr, token))
+
+    determined = set(r for r in ruless if r.is_trivial())
+    ruless -= determined
+
+    ruleset = permute_and_interfere(ruless, token)
+    fronts = ruleset.split_fronts()
+
+    trivial_fronts = set(f for f in fronts if f.is_trivial())
+    determined |= set(f.trivial_rule() for f in trivial_fronts)
+    fronts -= trivial_fronts
+    return determined, fronts
 
 
 def condense_supercells(rules: Set[Rule]) -> Tuple[List[Rule_], List[frozenset]]:
@@ -1404,8 +2522,19 @@ def condense_supercells(rules: Set[Rule]) -> Tuple[List[Rule_], List[frozenset]]
 
 
 def solve(
-    rs: Set[Rule], mine_prevalence: MineCount, other_tag: Optional[Any] = None
-) -> Union[Dict[Optional[str], Union[float, float]], Dict[str, float], Dict[str, float]]:
+    rs: Set[Rule],
+    mine_prevalence: MineCount,
+    other_tag: Optional[Any] = None,
+    out: Optional[List[float]] = None,
+    tally_cache: Optional[FrontTallyCache] = None,
+    executor: Optional[concurrent.futures.Executor] = None,
+    mode: str = "exact",
+    budget_ms: Optional[float] = None,
+    rng: Optional[random.Random] = None,
+    token: Optional[CancellationToken] = None,
+    lazy: bool = False,
+    samples: Optional[int] = None,
+) -> Union[Dict[Optional[str], Union[float, float]], Dict[str, float], List[float], Solution, CellProbabilities]:
     """solve a minesweeper board.
 
     take in a minesweeper board and return the solution as a dict mapping each
@@ -1419,21 +2548,453 @@ def solve(
         vary for given board dimensions, in a binomial distribution)
     other_tag -- tag used to represent all 'other' cells (all cells not
         mentioned in a rule) in the solution output
+    out -- if given, cells must be integer ids (e.g., row * n_cols + col);
+        instead of building a dict, write the probability of every cell into
+        this flat buffer (see expand_cells_into()) and return it
+    tally_cache -- a FrontTallyCache to look up / store front tallies in,
+        rather than always enumerating each front
+    executor -- a concurrent.futures executor (typically a
+        ProcessPoolExecutor) to enumerate large fronts on in parallel; fronts
+        are independent, so they scale with the # of workers
+    mode -- "exact", or "approx" to sample the fronts too costly to count
+        exactly (see FrontSampler) and return a Solution with confidence
+        intervals. small fronts are still counted exactly. 'out' is not
+        supported in approximate mode
+    budget_ms -- approx mode: time to spend on the whole solve, in
+        milliseconds (default APPROX_BUDGET_MS). a budget that runs out
+        during the logical deduction phase acts like 'token' (see below);
+        after that, cheap fronts not counted exactly by then are sampled
+        instead, and sampling stops early enough to finish in time. cells of
+        fronts left without an estimate get the 'other' probability and a
+        (0, 1) interval
+    samples -- approx mode: instead of a time budget, draw this many samples
+        from each sampled front (rounded up to a multiple of APPROX_BATCHES)
+        and count every cheap front exactly, so the result depends on 'rng'
+        alone
+    rng -- approx mode: random source for sampling
+    token -- a CancellationToken to stop the solve early (e.g., on a
+        deadline). if it fires, return a Solution with 'complete' False,
+        holding just the cells found to be certainly safe or certainly mines
+        so far -- whatever 'mode'. with 'out', fill it with NaN instead,
+        except for those cells, and return it; a NaN entry marks an
+        incomplete solve
+    lazy -- return a CellProbabilities to query cells from on demand, rather
+        than expanding the solution to every cell. not supported with 'out'
+        or in approx mode
     """
-    rules, all_cells = condense_supercells(rs)
-    ruless = reduce_rules(rules)
-
-    determined = set(r for r in ruless if r.is_trivial())
-    ruless -= determined
-
-    ruleset = permute_and_interfere(ruless)
-    fronts = ruleset.split_fronts()
+    start = time.monotonic()
+    if mode not in ("exact", "approx"):
+        raise ValueError("unknown solve mode %r" % mode)
+    if mode == "approx" and out is not None:
+        raise ValueError("'out' is not supported in approx mode")
+    if lazy and (out is not None or mode == "approx"):
+        raise ValueError("'lazy' is not supported with 'out' or in approx mode")
+
+    # the approximate solve's time budget, which stops it like 'token' does until the sampling phase
+    budget = None
+    if mode == "approx" and samples is None:
+        budget = LinkedToken(start + (APPROX_BUDGET_MS if budget_ms is None else budget_ms) / 1000.0, token)
 
-    trivial_fronts = set(f for f in fronts if f.is_trivial())
-    determined |= set(f.trivial_rule() for f in trivial_fronts)
-    fronts -= trivial_fronts
+    rules, all_cells = condense_supercells(rs)
+    reducer = RuleReducer()
+    determined = None
+    try:
+        determined, fronts = reduce_and_split(rules, reducer, budget or token)
+
+        if mode == "approx":
+            return approximate_solution(
+                determined, fronts, mine_prevalence, all_cells, other_tag, budget, rng, tally_cache, executor, token,
+                samples,
+            )
+
+        stats = set(tally_fronts(fronts, tally_cache, executor, token))
+    except Cancelled:
+        if determined is None:
+            # stopped during the logical deduction phase
+            determined = set(rule for rule in reducer.active_rules if rule.is_trivial())
+        return partial_solution(determined, out)
 
-    stats = set(enumerate_front(f) for f in fronts)
     stats.update(r.tally() for r in determined)
     cell_probs = cell_probabilities(stats, mine_prevalence, all_cells)
+    if out is not None:
+        return expand_cells_into(cell_probs, out)
+    if lazy:
+        return CellProbabilities(cell_probs, other_tag)
     return dict(expand_cells(cell_probs, other_tag))
+
+
+class Solution(dict):
+    """an approximate or partial solve() result: mapping cell -> estimated
+    probability of being a mine, with a confidence interval for each"""
+
+    def __init__(
+        self, probs: Dict, intervals: Dict[Any, Tuple[float, float]], samples: int, complete: bool = True
+    ) -> None:
+        super().__init__(probs)
+        # mapping: cell -> (low, high) bounds of a 95% confidence interval on its probability
+        self.intervals = intervals
+        # total # of samples drawn; 0 if every front was counted exactly
+        self.samples = samples
+        # False if the solve was cancelled, and only some cells are present
+        self.complete = complete
+
+    @property
+    def exact(self) -> bool:
+        """whether no front needed sampling, i.e., the probabilities are exact"""
+        return self.samples == 0
+
+
+def certain_cells(determined: Iterable[Rule_]) -> Dict[Any, float]:
+    """return mapping: cell -> 0.0 (safe) or 1.0 (mine), for the cells of
+    the trivial rules that are certainly safe or certainly mines"""
+    probs = {}
+    for rule in determined:
+        cell_ = peek(rule.cells_)
+        if rule.num_mines in (0, len(cell_)):
+            for cell in cell_:
+                probs[cell] = 1.0 if rule.num_mines else 0.0
+    return probs
+
+
+def partial_solution(determined: Set[Rule_], out: Optional[List[float]] = None) -> Union[Solution, List[float]]:
+    """the result of a cancelled solve(): the cells of the trivial rules
+    found so far that are certainly safe or certainly mines. if 'out' is
+    given, write those into it (NaN everywhere else) and return it"""
+    probs = certain_cells(determined)
+    if out is not None:
+        out[:] = [math.nan] * len(out)
+        for cell, p in probs.items():
+            out[cell] = p
+        return out
+    return Solution(probs, dict((cell, (p, p)) for cell, p in probs.items()), 0, complete=False)
+
+
+def prove_cells(
+    front: PermutedRuleset, targets: Iterable[frozenset], token: Optional[CancellationToken] = None
+) -> Dict[frozenset, float]:
+    """enumerate a front to find which of the supercells 'targets' are
+    empty in every configuration, or full in every one; stop as soon as
+    every target has been seen to vary
+
+    return -- mapping: supercell -> 0.0 (safe) or 1.0 (mines), for the
+      certain targets"""
+    index = front.cell_index
+    # mapping: supercell -> [field mask, empty in every configuration so far, full in every configuration so far]
+    undecided = dict((cell_, [index.masks[index.index[cell_]], True, True]) for cell_ in targets)
+    seen = False
+    for config in EnumerationState(front, token=token).enumerate():
+        seen = True
+        for cell_, status in list(undecided.items()):
+            n = (config & status[0]).bit_count()
+            status[1] = status[1] and n == 0
+            status[2] = status[2] and n == len(cell_)
+            if not (status[1] or status[2]):
+                del undecided[cell_]
+        if not undecided:
+            break
+    if not seen:
+        raise InconsistencyError("mine front has no possible configurations")
+    return dict((cell_, 0.0 if empty else 1.0) for cell_, (_, empty, _) in undecided.items())
+
+
+def solve_certain(
+    rs: Set[Rule], prove: Iterable[Any] = (), token: Optional[CancellationToken] = None
+) -> Dict[Any, float]:
+    """find the cells of a minesweeper board that are certainly safe or
+    certainly mines, without counting any configurations
+
+    return a dict mapping each such cell to 0.0 (safe) or 1.0 (mine).
+    certainties come from the logical deduction and permutation phases
+    (see reduce_and_split()), which are sound but not complete: a cell can
+    also be pinned down by its front as a whole, which only enumeration
+    reveals. the total # of mines is not taken into account
+
+    rs -- a set of 'Rule' describing the board
+    prove -- cells to settle by enumerating the fronts they're in, if the
+        cheap phases leave them undetermined
+    token -- see solve(); cancellation raises Cancelled
+    """
+    rules, all_cells = condense_supercells(rs)
+    determined, fronts = reduce_and_split(rules, token=token)
+    certain = certain_cells(determined)
+
+    prove = set(prove).difference(certain)
+    for front in fronts if prove else ():
+        targets = [cell_ for cell_ in front.cells_ if not prove.isdisjoint(cell_)]
+        if targets:
+            for cell_, p in prove_cells(front, targets, token).items():
+                for cell in cell_:
+                    certain[cell] = p
+    return certain
+
+
+def approximate_solution(
+    determined: Set[Rule_],
+    fronts: List[PermutedRuleset],
+    mine_prevalence: MineCount,
+    all_cells: List[frozenset],
+    other_tag: Optional[Any],
+    budget: Optional[CancellationToken],
+    rng: Optional[random.Random] = None,
+    tally_cache: Optional[FrontTallyCache] = None,
+    executor: Optional[concurrent.futures.Executor] = None,
+    token: Optional[CancellationToken] = None,
+    samples: Optional[int] = None,
+) -> Solution:
+    """the tail of solve() in approximate mode: count the cheap fronts
+    exactly, sample the rest, and solve once with the pooled estimates and
+    once per batch of samples; the spread of the batch solutions gives the
+    confidence intervals
+
+    with a 'budget' (a token with a deadline, linked to 'token'), cheap
+    fronts are counted in order of cost until it runs out, the rest being
+    sampled instead; sampling stops in time for the final solves, and batch
+    solves that don't fit are skipped. without one, every cheap front is
+    counted and every sampled front gets 'samples' samples"""
+    rng = random.Random() if rng is None else rng
+    exact = [r.tally() for r in determined]
+    samplers = []
+    costs = [exact_cost(front) for front in fronts]
+    # fronts come as a set; order them by content so a seeded 'rng' reproduces the samples
+    for cost, front in sorted(zip(costs, fronts), key=lambda e: (e[0], hash(frozenset(e[1].cells_)))):
+        if cost >= APPROX_MIN_COST:
+            samplers.append(FrontSampler(front, rng, token))
+            continue
+        try:
+            if budget is not None:
+                budget.check()
+            exact.extend(tally_fronts([front], tally_cache, executor, budget or token))
+        except Cancelled:
+            if token is not None and token.cancelled():
+                raise
+            samplers.append(FrontSampler(front, rng, token))
+
+    def probabilities(estimates: Dict[FrontSampler, FrontTally]) -> Tuple[Dict[frozenset, float], Optional[float]]:
+        """solve with the exact tallies and the given estimates; the cells of
+        the other sampled fronts are treated as uncharted. return the
+        per-cell probability of each supercell, and that of the 'other'
+        cells (None if there are none)"""
+        stats = set(tally.copy() for tally in exact)
+        stats.update(estimates.values())
+        unestimated = set(cell_ for sampler in samplers if sampler not in estimates for cell_ in sampler.cells_)
+        charted = [cell_ for cell_ in all_cells if cell_ not in unestimated]
+        probs, other = {}, None
+        for cell_, p in cell_probabilities(stats, mine_prevalence, charted):
+            if isinstance(cell_, UnchartedCell):
+                other = p / len(cell_) if len(cell_) else None
+            else:
+                probs[cell_] = p / len(cell_)
+        for cell_ in unestimated:
+            probs[cell_] = other
+        return probs, other
+
+    def expand(probs: Dict[frozenset, Any], other: Any) -> Dict:
+        expanded = dict((cell, p) for cell_, p in probs.items() for cell in cell_)
+        if other is not None:
+            expanded[other_tag] = other
+        return expanded
+
+    if not samplers:
+        probs = expand(*probabilities({}))
+        return Solution(probs, dict((cell, (p, p)) for cell, p in probs.items()), 0)
+
+    # the final solves cost about as much as this one, with no estimates at all
+    reserve = 0.0
+    if budget is not None:
+        started = time.monotonic()
+        baseline = probabilities({})
+        reserve = (APPROX_BATCHES + 1) * (time.monotonic() - started)
+
+    def finished(sampler: FrontSampler) -> bool:
+        if samples is not None:
+            return sampler.samples >= samples
+        return budget.cancelled() or budget.remaining() <= reserve
+
+    while not all(finished(sampler) for sampler in samplers):
+        for sampler in samplers:
+            if finished(sampler):
+                continue
+            for _ in range(APPROX_BATCHES):
+                sampler.sample()
+    if token is not None:
+        token.check()
+
+    estimates = dict((sampler, sampler.estimate()) for sampler in samplers if any(sampler.hits))
+    probs, other = probabilities(estimates) if estimates or budget is None else baseline
+
+    # batch solutions leave out the fronts some batch has no estimate for
+    ready = [sampler for sampler in samplers if sampler.is_ready()]
+    batch_probs = []
+    for batch in range(APPROX_BATCHES if ready else 0):
+        if budget is not None and budget.cancelled():
+            break
+        try:
+            batch_probs.append(probabilities(dict((sampler, sampler.estimate(batch)) for sampler in ready)))
+        except (InconsistencyError, ZeroDivisionError):
+            # a batch can miss every mine count the rest of the board allows
+            pass
+
+    def interval(p: float, values: List[float]) -> Tuple[float, float]:
+        mean = sum(values) / len(values)
+        stddev = math.sqrt(sum((v - mean) ** 2 for v in values) / (len(values) - 1))
+        half_width = APPROX_T_QUANTILE * stddev / math.sqrt(len(values))
+        return (max(p - half_width, 0.0), min(p + half_width, 1.0))
+
+    unready = set(cell_ for sampler in samplers if not sampler.is_ready() for cell_ in sampler.cells_)
+    intervals = {}
+    for cell_, p in probs.items():
+        if len(batch_probs) < 2 or cell_ in unready:
+            intervals[cell_] = (0.0, 1.0)
+        else:
+            intervals[cell_] = interval(p, [bp[cell_] for bp, _ in batch_probs])
+    if other is not None:
+        intervals_other = (0.0, 1.0) if len(batch_probs) < 2 else interval(other, [bo for _, bo in batch_probs])
+    else:
+        intervals_other = None
+    return Solution(
+        expand(probs, other), expand(intervals, intervals_other), sum(sampler.samples for sampler in samplers)
+    )
+
+
+class RuleComponent(object):
+    """a set of raw rules that are connected to each other through shared
+    cells, and share no cells with any rule outside the set. the unit of
+    re-use in a SolverSession: each component is solved (condensed, reduced,
+    permuted and enumerated) independently of all others"""
+
+    def __init__(self, rules: frozenset, token: Optional[CancellationToken] = None) -> None:
+        """rules -- set of 'Rule'
+        token -- see solve(); cancellation raises Cancelled"""
+        self.rules = rules
+
+        condensed, self.cells_ = condense_supercells(rules)
+        # trivial rules, and the remaining fronts
+        self.determined, self.fronts = reduce_and_split(condensed, token=token)
+        # finalized tallies of 'fronts', filled in by the session; must be
+        # copied before being weighted
+        self.tallies: List[FrontTally] = []
+
+
+class SolverSession(object):
+    """a stateful solver for a game in progress. rather than rebuilding the
+    whole board each turn, the caller submits the rules added and removed
+    since the last solve.
+
+    the session keeps the rules partitioned into independent RuleComponents
+    and caches the reduced rules and front tallies of each; a solve only
+    re-processes the components touched by the delta, then re-runs the global
+    mine-count weighting (combine_fronts) over all of them
+    """
+
+    def __init__(
+        self,
+        mine_prevalence: MineCount,
+        other_tag: Optional[Any] = None,
+        tally_cache: Optional[FrontTallyCache] = None,
+        executor: Optional[concurrent.futures.Executor] = None,
+    ) -> None:
+        """see solve() for arguments"""
+        self.mine_prevalence = mine_prevalence
+        self.other_tag = other_tag
+        self.tally_cache = tally_cache
+        self.executor = executor
+        # current set of 'Rule'
+        self.rules: Set[Rule] = set()
+        # mapping: cell -> set of rules the cell appears in
+        self.cell_rules: Dict[Any, Set[Rule]] = collections.defaultdict(set)
+        # mapping: rule -> up-to-date component containing it
+        self.components: Dict[Rule, RuleComponent] = {}
+        # rules whose component must be (re-)solved
+        self.dirty: Set[Rule] = set()
+        self.stats = collections.Counter()
+
+    def update(self, added: Iterable[Rule] = (), removed: Iterable[Rule] = ()) -> None:
+        """apply a rule delta"""
+        for rule in removed:
+            self.invalidate(rule)
+            self.rules.remove(rule)
+            self.dirty.discard(rule)
+            for cell in rule.cells:
+                self.cell_rules[cell].remove(rule)
+                if not self.cell_rules[cell]:
+                    del self.cell_rules[cell]
+
+        for rule in added:
+            if rule in self.rules:
+                continue
+            self.rules.add(rule)
+            self.dirty.add(rule)
+            for cell in rule.cells:
+                for rule_ov in self.cell_rules[cell]:
+                    self.invalidate(rule_ov)
+                self.cell_rules[cell].add(rule)
+
+    def invalidate(self, rule: Rule) -> None:
+        """mark the component containing 'rule' as needing to be re-solved"""
+        component = self.components.get(rule)
+        if component is None:
+            return
+        for r in component.rules:
+            del self.components[r]
+            self.dirty.add(r)
+
+    def partition(self, rules: Set[Rule]) -> Iterator[frozenset]:
+        """split 'rules' into connected components; 'rules' must be closed
+        under overlap"""
+        related_rules = dict(
+            (rule, set().union(*(self.cell_rules[cell] for cell in rule.cells)) - set([rule])) for rule in rules
+        )
+        while related_rules:
+            frontier = [peek(related_rules)]
+            component = set(frontier)
+            while frontier:
+                for rule_ov in related_rules.pop(frontier.pop()):
+                    if rule_ov not in component:
+                        component.add(rule_ov)
+                        frontier.append(rule_ov)
+            yield set_(component)
+
+    def refresh(self, token: Optional[CancellationToken] = None) -> int:
+        """re-solve all components affected by updates since the last solve;
+        return the # of components solved
+
+        token -- see solve(); cancellation raises Cancelled, leaving the
+            components still to be solved dirty for the next refresh"""
+        components = [RuleComponent(rules, token) for rules in self.partition(self.dirty)]
+        # tally all new fronts in one batch, so they can be spread across the executor
+        fronts = [(component, front) for component in components for front in component.fronts]
+        tallies = tally_fronts([f for _, f in fronts], self.tally_cache, self.executor, token)
+        for (component, _), tally in zip(fronts, tallies):
+            component.tallies.append(tally)
+
+        for component in components:
+            for rule in component.rules:
+                self.components[rule] = component
+            self.dirty -= component.rules
+        return len(components)
+
+    def solve(
+        self, out: Optional[List[float]] = None, lazy: bool = False, token: Optional[CancellationToken] = None
+    ) -> Union[Dict[Any, float], List[float], CellProbabilities, Solution]:
+        """solve the board as of the current ruleset; see solve(). if 'token'
+        fires, return a partial result (see partial_solution()) of the
+        components already solved"""
+        if lazy and out is not None:
+            raise ValueError("'lazy' is not supported with 'out'")
+        try:
+            num_solved = self.refresh(token)
+        except Cancelled:
+            return partial_solution(set(r for component in self.components.values() for r in component.determined), out)
+        components = set(self.components.values())
+        self.stats["components_solved"] += num_solved
+        self.stats["components_reused"] += len(components) - num_solved
+
+        stats = set(tally.copy() for component in components for tally in component.tallies)
+        stats.update(r.tally() for component in components for r in component.determined)
+        all_cells = [cell_ for component in components for cell_ in component.cells_]
+        cell_probs = cell_probabilities(stats, self.mine_prevalence, all_cells)
+        if out is not None:
+            return expand_cells_into(cell_probs, out)
+        if lazy:
+            return CellProbabilities(cell_probs, self.other_tag)
+        return dict(expand_cells(cell_probs, self.other_tag))
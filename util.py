@@ -1,23 +1,10 @@
-import math
+import weakref
 import operator
 import collections
 from functools import reduce
 
-
-def fact_div(a, b):
-    """return a! / b!"""
-    return product(range(b + 1, a + 1)) if a >= b else 1.0 / fact_div(b, a)
-
-
-def choose(n, k):
-    """return n choose k
-
-    resilient (though not immune) to integer overflow"""
-    if n == 1:
-        # optimize by far most-common case
-        return 1
-
-    return fact_div(n, max(k, n - k)) / math.factorial(min(k, n - k))
+# exact, table-backed; see combinatorics.py
+from combinatorics import choose, fact_div
 
 
 def peek(iterable):
@@ -78,6 +65,8 @@ def map_reduce(data, emitfunc=lambda rec: [(rec,)], reducefunc=lambda v: v):
 class ImmutableMixin(object):
     """mixin for immutable, hashable objects"""
 
+    __slots__ = ()
+
     def _canonical(self):
         """return the 'core' data of this object in a hashable format, usually a tuple"""
         assert False, "must override"
@@ -90,3 +79,44 @@ class ImmutableMixin(object):
 
     def __hash__(self):
         return hash(self._canonical())
+
+
+class CachedImmutableMixin(ImmutableMixin):
+    """an ImmutableMixin that hashes itself only once, for objects that go in
+    and out of sets and dicts many times over
+
+    subclasses must declare __slots__ for their own fields, set them all in
+    __init__, and never modify them afterwards"""
+
+    __slots__ = ("_hash", "__weakref__")
+
+    # per-class tables for interned(): canonical form -> shared instance
+    _interned = collections.defaultdict(weakref.WeakValueDictionary)
+
+    def _equivalent(self, o):
+        """compare the 'core' data of two objects of the same type; override
+        if there is a cheaper test than comparing _canonical()"""
+        return self._canonical() == o._canonical()
+
+    def __eq__(self, o):
+        return self is o or (type(self) == type(o) and hash(self) == hash(o) and self._equivalent(o))
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(self._canonical())
+            return self._hash
+
+    def __getstate__(self):
+        # drop the cached hash: str hashes are salted per process, so it is
+        # wrong in any other process this object is unpickled in
+        state, slots = super().__getstate__()
+        slots.pop("_hash", None)
+        return (state, slots)
+
+    def interned(self):
+        """return the shared instance equal to this one, making this one the
+        shared instance if there is none yet. the table only holds weak
+        references, so instances still die once no longer in use elsewhere"""
+        return CachedImmutableMixin._interned[type(self)].setdefault(self._canonical(), self)